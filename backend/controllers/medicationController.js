@@ -1,5 +1,6 @@
 const Medication = require('../models/Medication');
 const AdherenceLog = require('../models/AdherenceLog');
+const { ingestAdherenceLog } = require('./mlController');
 
 // Add Medication
 exports.addMedication = async (req, res) => {
@@ -81,6 +82,9 @@ exports.logAdherence = async (req, res) => {
       notes
     });
 
+    // Not awaited: the response does not wait on the ML service
+    ingestAdherenceLog(log);
+
     res.status(201).json({ success: true, data: log });
   } catch (error) {
     res.status(500).json({ message: error.message });
@@ -1,26 +1,107 @@
 const axios = require('axios');
+const AdherenceLog = require('../models/AdherenceLog');
 
 // Use environment variable for production, fallback to localhost for development
 const ML_SERVICE_URL = process.env.ML_SERVICE_HOST 
   ? `https://${process.env.ML_SERVICE_HOST}` 
   : 'http://localhost:5001';
 
+// The ML service only reads or updates a user's stored history (user_id,
+// /features) for requests carrying this shared secret
+const ML_INTERNAL_HEADERS = {
+  'Content-Type': 'application/json',
+  'X-Internal-Token': process.env.ML_INTERNAL_TOKEN || ''
+};
+
+// Days of logs to backfill; the longest of the ML service's ML_FEATURE_WINDOWS_DAYS
+const FEATURE_HISTORY_DAYS = Number(process.env.ML_FEATURE_HISTORY_DAYS || 30);
+
+// Users backfilled at once when a response reports several incomplete histories
+const BACKFILL_CONCURRENCY = 10;
+
+// The ML feature store lives in memory, so a restart or redeploy empties it.
+// Send a user's recent logs from Mongo (plus the latest taken dose, for the
+// time since the last dose). Resolves false if the backfill failed, which
+// only means the ML service falls back to its defaults.
+const backfillFeatures = async (userId) => {
+  try {
+    const since = new Date(Date.now() - FEATURE_HISTORY_DAYS * 24 * 60 * 60 * 1000);
+    const fields = 'scheduledTime status takenTime';
+    const [logs, lastTaken] = await Promise.all([
+      AdherenceLog.find({ userId, scheduledTime: { $gte: since } }).select(fields).lean(),
+      AdherenceLog.findOne({ userId, status: 'taken', scheduledTime: { $lt: since } })
+        .sort({ takenTime: -1 }).select(fields).lean()
+    ]);
+    if (lastTaken) {
+      logs.push(lastTaken);
+    }
+
+    await axios.post(`${ML_SERVICE_URL}/features/backfill`, {
+      user_id: userId,
+      logs
+    }, {
+      timeout: 10000,
+      headers: ML_INTERNAL_HEADERS
+    });
+    return true;
+  } catch (error) {
+    console.error('ML feature backfill failed:', error.message);
+    return false;
+  }
+};
+
+// Send a prediction request. The ML service says in its response whether it
+// had each user's complete history; only if not, backfill those users and ask
+// again, so the usual call stays a single round trip.
+const predictWithHistory = async (request, incompleteUsers) => {
+  const response = await request();
+  const users = incompleteUsers(response.data);
+  if (users.length === 0) {
+    return response;
+  }
+
+  const backfilled = [];
+  for (let i = 0; i < users.length; i += BACKFILL_CONCURRENCY) {
+    const group = users.slice(i, i + BACKFILL_CONCURRENCY);
+    backfilled.push(...await Promise.all(group.map(backfillFeatures)));
+  }
+  return backfilled.some(Boolean) ? request() : response;
+};
+
+// Batch record without caller-sent history fields; the feature store's are used
+const withoutHistory = (record) => {
+  const { past_adherence_rate, hours_since_last_dose, ...rest } = record || {};
+  return rest;
+};
+
+// Batch record scored for userId, whatever user_id it carries
+const ownRecord = (record, userId) => ({ ...withoutHistory(record), user_id: userId });
+
+// Score batch records with the ML service, backfilling users it lacks history for
+const predictRecords = (records) => predictWithHistory(
+  () => axios.post(`${ML_SERVICE_URL}/predict/batch`, { records }, {
+    timeout: 60000,
+    headers: ML_INTERNAL_HEADERS
+  }),
+  data => Object.keys(data.history_complete || {}).filter(id => !data.history_complete[id])
+);
+
 exports.predictAdherenceRisk = async (req, res) => {
   try {
-    const { hour_of_day, day_of_week, num_daily_meds, past_adherence_rate, hours_since_last_dose } = req.body;
+    const { hour_of_day, day_of_week, num_daily_meds, time } = req.body;
     
-    const response = await axios.post(`${ML_SERVICE_URL}/predict`, {
+    // past_adherence_rate and hours_since_last_dose come from the ML service's
+    // feature store for this user; values sent by the client are ignored
+    const response = await predictWithHistory(() => axios.post(`${ML_SERVICE_URL}/predict`, {
+      user_id: req.user.id,
+      time,
       hour_of_day,
       day_of_week,
-      num_daily_meds,
-      past_adherence_rate,
-      hours_since_last_dose
+      num_daily_meds
     }, {
       timeout: 10000, // 10 second timeout
-      headers: {
-        'Content-Type': 'application/json'
-      }
-    });
+      headers: ML_INTERNAL_HEADERS
+    }), data => (data.features && data.features.history_complete ? [] : [req.user.id]));
     
     res.json({
       success: true,
@@ -35,13 +116,97 @@ exports.predictAdherenceRisk = async (req, res) => {
   }
 };
 
+// Forward a new adherence log to the ML service's feature store. Never throws:
+// a failure only leaves that user's features stale until the next log.
+exports.ingestAdherenceLog = (log) => {
+  return axios.post(`${ML_SERVICE_URL}/features/ingest`, {
+    logs: [{
+      userId: log.userId,
+      scheduledTime: log.scheduledTime,
+      status: log.status,
+      takenTime: log.takenTime
+    }]
+  }, {
+    timeout: 5000,
+    headers: ML_INTERNAL_HEADERS
+  }).catch(error => {
+    console.error('ML feature ingest failed:', error.message);
+  });
+};
+
+exports.predictAdherenceRiskBatch = async (req, res) => {
+  try {
+    const { records } = req.body;
+
+    if (!Array.isArray(records)) {
+      return res.status(400).json({
+        success: false,
+        message: 'records must be an array'
+      });
+    }
+
+    // One round trip for the whole batch; results come back in input order.
+    // This route only scores the logged-in user's records: each one uses the
+    // caller's own stored history, whatever user_id or history fields it
+    // carries. Sweeps across users go through predictAdherenceRiskSweep.
+    const response = await predictRecords(records.map(record => ownRecord(record, req.user.id)));
+    
+    res.json({
+      success: true,
+      data: response.data.predictions
+    });
+  } catch (error) {
+    console.error('ML Service Error:', error.message);
+    res.status(500).json({
+      success: false,
+      message: 'ML service unavailable: ' + error.message
+    });
+  }
+};
+
+// Score records of many users in one call, e.g. the nightly risk sweep. The
+// route takes the service token (protectService) instead of a user login, so
+// each record names its user: { records: [{ user_id, time, num_daily_meds }] }.
+// Send large sweeps in several calls to stay within the timeout.
+exports.predictAdherenceRiskSweep = async (req, res) => {
+  try {
+    const { records } = req.body;
+
+    if (!Array.isArray(records) || records.some(record => !record || !record.user_id)) {
+      return res.status(400).json({
+        success: false,
+        message: 'records must be an array of records with a user_id'
+      });
+    }
+
+    const response = await predictRecords(records.map(record => ({
+      ...withoutHistory(record),
+      user_id: String(record.user_id)
+    })));
+
+    res.json({
+      success: true,
+      data: response.data.predictions
+    });
+  } catch (error) {
+    console.error('ML Service Error:', error.message);
+    res.status(500).json({
+      success: false,
+      message: 'ML service unavailable: ' + error.message
+    });
+  }
+};
+
 exports.suggestOptimalTimes = async (req, res) => {
   try {
-    const { num_daily_meds, past_adherence_rate } = req.body;
+    const { num_daily_meds, past_adherence_rate, hours, day_of_week, top_k } = req.body;
     
     const response = await axios.post(`${ML_SERVICE_URL}/suggest-times`, {
       num_daily_meds,
-      past_adherence_rate
+      past_adherence_rate,
+      hours,
+      day_of_week,
+      top_k
     }, {
       timeout: 10000,
       headers: {
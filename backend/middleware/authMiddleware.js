@@ -1,3 +1,4 @@
+const crypto = require('crypto');
 const jwt = require('jsonwebtoken');
 const User = require('../models/User');
 
@@ -26,4 +27,19 @@ const protect = async (req, res, next) => {
   }
 };
 
-module.exports = { protect };
\ No newline at end of file
+// For jobs that act for the whole service rather than one user (e.g. the
+// nightly risk sweep): the X-Service-Token header must match SERVICE_API_TOKEN.
+// With SERVICE_API_TOKEN unset, these routes are refused.
+const protectService = (req, res, next) => {
+  const expected = Buffer.from(process.env.SERVICE_API_TOKEN || '');
+  const token = Buffer.from(req.headers['x-service-token'] || '');
+
+  if (expected.length === 0 || token.length !== expected.length ||
+      !crypto.timingSafeEqual(token, expected)) {
+    return res.status(401).json({ message: 'Not authorized, service token required' });
+  }
+
+  next();
+};
+
+module.exports = { protect, protectService };
\ No newline at end of file
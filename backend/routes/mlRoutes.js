@@ -1,11 +1,20 @@
 const express = require('express');
 const router = express.Router();
-const { predictAdherenceRisk, suggestOptimalTimes } = require('../controllers/mlController');
-const { protect } = require('../middleware/authMiddleware');
+const {
+  predictAdherenceRisk,
+  predictAdherenceRiskBatch,
+  predictAdherenceRiskSweep,
+  suggestOptimalTimes
+} = require('../controllers/mlController');
+const { protect, protectService } = require('../middleware/authMiddleware');
+
+// Scores records of any users, so it takes the service token, not a user login
+router.post('/predict-risk/sweep', protectService, predictAdherenceRiskSweep);
 
 router.use(protect);
 
 router.post('/predict-risk', predictAdherenceRisk);
+router.post('/predict-risk/batch', predictAdherenceRiskBatch);
 router.post('/suggest-times', suggestOptimalTimes);
 
 module.exports = router;
\ No newline at end of file
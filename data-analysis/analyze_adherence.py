@@ -1,62 +1,105 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
 import json
+from log_stream import LogAggregates, compact_logs, memory_footprint, read_logs
+from streaks import compute_streaks
+from generate_logs import generate_chunks
 
 class AdherenceAnalyzer:
-    def __init__(self, adherence_logs_file='adherence_logs.csv'):
+    def __init__(self, adherence_logs_file='adherence_logs.csv', chunksize=None,
+                 aggregates=None):
         """
         Initialize with adherence logs data
         
         CSV should have columns: user_id, medication_id, scheduled_time, 
         taken_time, status, day_of_week, hour_of_day
+        
+        The log is held in a compact layout (see log_stream.read_logs):
+        categorical IDs and status, int8 hour/day, datetime64 timestamps.
+        
+        With chunksize set, the file is streamed in chunks of that many rows
+        and only running aggregates are kept (self.df is None), so logs
+        larger than memory can be reported on. Alternatively pass prebuilt
+        aggregates, e.g. LogStore(...).aggregate(start=...), to report on
+        a filtered slice of the Parquet log store.
         """
+        # Per-group counts shared by the report sections, see _aggregate()
+        self._aggregates = aggregates
+        self.df = None
+        
         try:
-            self.df = pd.read_csv(adherence_logs_file)
-            print(f"✓ Loaded {len(self.df)} records")
+            if aggregates is not None:
+                print(f"✓ Using {aggregates.total} aggregated records")
+            elif chunksize:
+                self._aggregates = LogAggregates.from_csv(adherence_logs_file, chunksize)
+                print(f"✓ Streamed {self._aggregates.total} records")
+            else:
+                self.df = read_logs(adherence_logs_file)
+                print(f"✓ Loaded {len(self.df)} records "
+                      f"({self.memory_usage()['total'] / 2**20:.1f} MB in memory)")
         except FileNotFoundError:
             print("⚠ Data file not found. Generating sample data...")
             self.df = self._generate_sample_data()
             self.df.to_csv(adherence_logs_file, index=False)
             print(f"✓ Generated {len(self.df)} sample records")
     
-    def _generate_sample_data(self, n_records=500):
-        """Generate sample adherence data for testing"""
-        np.random.seed(42)
-        data = []
-        
-        for i in range(n_records):
-            day_of_week = np.random.randint(0, 7)
-            hour = np.random.choice([8, 13, 20], p=[0.4, 0.3, 0.3])
-            
-            # Create realistic adherence patterns
-            base_adherence = 0.75
-            if day_of_week >= 5:  # Weekend
-                base_adherence -= 0.15
-            if hour == 8:  # Morning better
-                base_adherence += 0.1
-            
-            status = 'taken' if np.random.random() < base_adherence else 'missed'
-            
-            scheduled = datetime.now() - timedelta(days=n_records-i)
-            taken = scheduled + timedelta(minutes=np.random.randint(-30, 120)) if status == 'taken' else None
-            
-            data.append({
-                'user_id': f'user_{np.random.randint(1, 11)}',
-                'medication_id': f'med_{np.random.randint(1, 6)}',
-                'scheduled_time': scheduled.strftime('%Y-%m-%d %H:%M:%S'),
-                'taken_time': taken.strftime('%Y-%m-%d %H:%M:%S') if taken else None,
-                'status': status,
-                'day_of_week': day_of_week,
-                'hour_of_day': hour
-            })
+    @classmethod
+    def from_aggregates(cls, aggregates):
+        """Analyzer over prebuilt aggregates, without loading or logging anything"""
+        analyzer = cls.__new__(cls)
+        analyzer._aggregates = aggregates
+        analyzer.df = None
+        return analyzer
+    
+    @classmethod
+    def from_frame(cls, df):
+        """Analyzer over an in-memory log DataFrame, without loading or logging anything"""
+        analyzer = cls.__new__(cls)
+        analyzer._aggregates = None
+        analyzer.df = compact_logs(df)
+        return analyzer
+    
+    def memory_usage(self):
+        """Bytes held by each column of the loaded log and in total (0 if streamed)"""
+        if self.df is None:
+            return {'columns': {}, 'total': 0}
+        return memory_footprint(self.df)
+    
+    def _generate_sample_data(self, n_records=500, n_users=10):
+        """Generate sample adherence data for testing (see generate_logs.py)"""
+        n_days = -(-n_records // n_users)
+        start = pd.Timestamp.now().floor('D') - pd.Timedelta(days=n_days)
+        chunks = generate_chunks(n_users, n_medications=1, n_days=n_days, seed=42,
+                                 start=start, medication_pool=5)
+        return pd.concat(chunks, ignore_index=True).head(n_records)
+    
+    def _aggregate(self):
+        """
+        Dose counts for every report section, computed once and cached.
         
-        return pd.DataFrame(data)
+        See LogAggregates: each grouping column is encoded to integer codes
+        (IDs in order of first appearance, like unique()) and counted with
+        np.bincount, instead of filtering the DataFrame once per group.
+        """
+        if self._aggregates is None:
+            self._aggregates = LogAggregates.from_frame(self.df)
+        return self._aggregates
+    
+    def _ranked(self, total, taken, limit=None):
+        """Group indices sorted by adherence rate (desc), ties in first-seen order"""
+        rates = np.zeros(len(total))
+        np.divide(taken, total, out=rates, where=total > 0)
+        rates *= 100
+        # Round as the report does so ties match the rounded values shown
+        rounded = np.array([round(rate, 2) for rate in rates.tolist()])
+        order = np.argsort(-rounded, kind='stable')
+        return order[:limit], rounded
     
     def overall_adherence_rate(self):
         """Calculate overall adherence rate"""
-        total = len(self.df)
-        taken = len(self.df[self.df['status'] == 'taken'])
+        agg = self._aggregate()
+        total = agg.total
+        taken = agg.taken
         rate = (taken / total * 100) if total > 0 else 0
         
         return {
@@ -68,21 +111,16 @@ class AdherenceAnalyzer:
     
     def adherence_by_time_of_day(self):
         """Analyze adherence by time of day"""
-        time_groups = {
-            'Morning (6-12)': self.df[self.df['hour_of_day'].between(6, 11)],
-            'Afternoon (12-18)': self.df[self.df['hour_of_day'].between(12, 17)],
-            'Evening (18-24)': self.df[self.df['hour_of_day'].between(18, 23)]
-        }
+        time_labels = ['Morning (6-12)', 'Afternoon (12-18)', 'Evening (18-24)']
+        totals, takens = self._aggregate().time_of_day_counts()
         
         results = {}
-        for time_label, group in time_groups.items():
-            if len(group) > 0:
-                taken = len(group[group['status'] == 'taken'])
-                rate = (taken / len(group) * 100)
+        for time_label, total, taken in zip(time_labels, totals.tolist(), takens.tolist()):
+            if total > 0:
                 results[time_label] = {
-                    'total': len(group),
+                    'total': total,
                     'taken': taken,
-                    'rate': round(rate, 2)
+                    'rate': round(taken / total * 100, 2)
                 }
         
         return results
@@ -90,92 +128,141 @@ class AdherenceAnalyzer:
     def adherence_by_day_of_week(self):
         """Analyze adherence by day of week"""
         days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        results = {}
+        agg = self._aggregate()
+        totals, takens = agg.day_total, agg.day_taken
         
-        for day_num, day_name in enumerate(days):
-            day_data = self.df[self.df['day_of_week'] == day_num]
-            if len(day_data) > 0:
-                taken = len(day_data[day_data['status'] == 'taken'])
-                rate = (taken / len(day_data) * 100)
+        results = {}
+        for day_name, total, taken in zip(days, totals.tolist(), takens.tolist()):
+            if total > 0:
                 results[day_name] = {
-                    'total': len(day_data),
+                    'total': total,
                     'taken': taken,
-                    'rate': round(rate, 2)
+                    'rate': round(taken / total * 100, 2)
                 }
         
         return results
     
     def user_adherence_ranking(self, top_n=10):
         """Rank users by adherence rate"""
-        user_stats = []
-        
-        for user_id in self.df['user_id'].unique():
-            user_data = self.df[self.df['user_id'] == user_id]
-            total = len(user_data)
-            taken = len(user_data[user_data['status'] == 'taken'])
-            rate = (taken / total * 100) if total > 0 else 0
-            
-            user_stats.append({
-                'user_id': user_id,
-                'total_doses': total,
-                'taken': taken,
-                'adherence_rate': round(rate, 2)
-            })
+        users, totals, takens = self._aggregate().users.counts()
+        order, rates = self._ranked(totals, takens, top_n)
         
-        # Sort by adherence rate
-        user_stats.sort(key=lambda x: x['adherence_rate'], reverse=True)
-        return user_stats[:top_n]
+        return [
+            {
+                'user_id': users[i],
+                'total_doses': int(totals[i]),
+                'taken': int(takens[i]),
+                'adherence_rate': float(rates[i])
+            }
+            for i in order
+        ]
     
     def medication_adherence_comparison(self):
         """Compare adherence rates across medications"""
-        med_stats = []
-        
-        for med_id in self.df['medication_id'].unique():
-            med_data = self.df[self.df['medication_id'] == med_id]
-            total = len(med_data)
-            taken = len(med_data[med_data['status'] == 'taken'])
-            rate = (taken / total * 100) if total > 0 else 0
-            
-            med_stats.append({
-                'medication_id': med_id,
-                'total_doses': total,
-                'taken': taken,
-                'adherence_rate': round(rate, 2)
-            })
+        meds, totals, takens = self._aggregate().medications.counts()
+        order, rates = self._ranked(totals, takens)
         
-        med_stats.sort(key=lambda x: x['adherence_rate'], reverse=True)
-        return med_stats
+        return [
+            {
+                'medication_id': meds[i],
+                'total_doses': int(totals[i]),
+                'taken': int(takens[i]),
+                'adherence_rate': float(rates[i])
+            }
+            for i in order
+        ]
     
     def weekly_trend_analysis(self, weeks=4):
-        """Analyze adherence trends over weeks"""
-        self.df['scheduled_time'] = pd.to_datetime(self.df['scheduled_time'])
-        self.df['week'] = self.df['scheduled_time'].dt.isocalendar().week
+        """Analyze adherence trends over the last N ISO weeks with doses"""
+        weekly = self._aggregate().daily.resample('W')
+        weekly = weekly[weekly['total'] > 0].tail(weeks)
         
         weekly_stats = []
-        for week in self.df['week'].unique()[-weeks:]:
-            week_data = self.df[self.df['week'] == week]
-            total = len(week_data)
-            taken = len(week_data[week_data['status'] == 'taken'])
-            rate = (taken / total * 100) if total > 0 else 0
-            
+        for year, week, total, taken in zip(weekly['iso_year'].tolist(), weekly['week'].tolist(),
+                                            weekly['total'].tolist(), weekly['taken'].tolist()):
             weekly_stats.append({
-                'week': int(week),
+                'year': year,
+                'week': week,
                 'total': total,
                 'taken': taken,
-                'rate': round(rate, 2)
+                'rate': round(taken / total * 100, 2)
             })
         
         return weekly_stats
     
+    def _streak_entry(self, row):
+        """JSON-friendly streak fields from one compute_streaks() row"""
+        since = row['days_since_last_miss']
+        return {
+            'current_streak': int(row['current_streak']),
+            'longest_streak': int(row['longest_streak']),
+            'days_since_last_miss': None if np.isnan(since) else int(since),
+            'last_missed_day': None if pd.isna(row['last_missed_day'])
+                               else str(row['last_missed_day'].date())
+        }
+    
+    def overall_streak(self):
+        """Current and longest run of days on which every scheduled dose was taken"""
+        daily = self._aggregate().daily
+        table = compute_streaks(np.zeros(len(daily.days), dtype=np.int64),
+                                daily.days.astype(np.int64), daily.total, daily.taken)
+        if table.empty:
+            return {'current_streak': 0, 'longest_streak': 0,
+                    'days_since_last_miss': None, 'last_missed_day': None}
+        return self._streak_entry(table.iloc[0])
+    
+    def adherence_streaks(self, by='user', top_n=None):
+        """
+        Streaks of fully adherent days per user or medication (see
+        streaks.py), longest current streak first, ties by longest streak
+        and then first appearance in the log
+        """
+        agg = self._aggregate()
+        if by == 'user':
+            labels, dose_days = agg.users.labels, agg.user_days
+        elif by == 'medication':
+            labels, dose_days = agg.medications.labels, agg.medication_days
+        else:
+            raise ValueError("by must be 'user' or 'medication'")
+        
+        # Days since last miss are counted to the last day in the whole log
+        as_of = agg.daily.days[-1] if len(agg.daily.days) else None
+        table = dose_days.streaks(as_of)
+        if table.empty:
+            return []
+        order = np.lexsort((-table['longest_streak'].to_numpy(),
+                            -table['current_streak'].to_numpy()))[:top_n]
+        
+        return [
+            {f'{by}_id': labels[code], **self._streak_entry(table.iloc[i])}
+            for i, code in zip(order.tolist(), table.index[order].tolist())
+        ]
+    
+    def dose_timing(self, late_after=30):
+        """
+        Delay distribution of taken doses (taken_time - scheduled_time)
+        overall and per user, medication, hour and weekday, with the share
+        taken more than late_after minutes late (see dose_timing.py).
+        None if the log was aggregated without its taken_time column.
+        """
+        return self._aggregate().dose_timing(late_after)
+    
     def generate_full_report(self):
         """Generate comprehensive analysis report"""
+        # The count-based sections share one aggregation pass over the log
+        self._aggregate()
         report = {
             'overall_adherence': self.overall_adherence_rate(),
             'by_time_of_day': self.adherence_by_time_of_day(),
             'by_day_of_week': self.adherence_by_day_of_week(),
             'top_users': self.user_adherence_ranking(5),
             'medication_comparison': self.medication_adherence_comparison(),
-            'weekly_trends': self.weekly_trend_analysis()
+            'weekly_trends': self.weekly_trend_analysis(),
+            'streaks': {
+                'overall': self.overall_streak(),
+                'top_users': self.adherence_streaks('user', 5)
+            },
+            'dose_timing': self.dose_timing()
         }
         
         return report
@@ -219,7 +306,28 @@ class AdherenceAnalyzer:
         print("\n6. WEEKLY TRENDS")
         print("-" * 40)
         for week_stat in report['weekly_trends']:
-            print(f"Week {week_stat['week']}: {week_stat['rate']}%")
+            print(f"Week {week_stat['year']}-W{week_stat['week']:02d}: {week_stat['rate']}%")
+        
+        print("\n7. STREAKS")
+        print("-" * 40)
+        overall = report['streaks']['overall']
+        print(f"All doses taken: {overall['current_streak']} days "
+              f"(longest {overall['longest_streak']})")
+        for user in report['streaks']['top_users']:
+            print(f"{user['user_id']}: {user['current_streak']} days "
+                  f"(longest {user['longest_streak']})")
+        
+        timing = report['dose_timing']
+        if timing is not None:
+            print("\n8. DOSE TIMING")
+            print("-" * 40)
+            overall = timing['overall']
+            print(f"Median delay: {overall['p50']} min (p90 {overall['p90']} min)")
+            print(f"Late (>{timing['late_after_minutes']} min): {overall['late_rate']}% "
+                  f"({overall['late']}/{overall['doses']})")
+            for hour, stats in timing.get('by_hour', {}).items():
+                print(f"{int(hour):02d}:00: median {stats['p50']} min, "
+                      f"{stats['late_rate']}% late")
         
         print("\n" + "="*60)
     
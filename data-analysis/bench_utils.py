@@ -0,0 +1,84 @@
+"""
+Timing and saved-run helpers for benchmark.py.
+
+The suite times its cases with time_call(), saves every run as JSON
+tagged with the git revision, and compares it with the previous saved
+run; cases slower than before by more than the tolerance are reported
+as regressions.
+
+ml-service/bench_utils.py has the same code. The services deploy
+separately, so each keeps its own copy; change both together.
+"""
+import glob
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+def time_call(fn, min_time=0.5, min_repeats=5):
+    """Return mean seconds per call, repeating until min_time has elapsed"""
+    fn()  # warm up
+    repeats = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        repeats += 1
+        elapsed = time.perf_counter() - start
+        if repeats >= min_repeats and elapsed >= min_time:
+            return elapsed / repeats
+
+def git_revision():
+    """Short hash of HEAD, or None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_results(results, results_dir, versions=None):
+    """
+    Write one run to results_dir/<timestamp>_<revision>.json, with the
+    Python and library versions ({name: version}); returns the path
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    revision = git_revision()
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(results_dir, f"{stamp}_{revision or 'unknown'}.json")
+    with open(path, 'w') as f:
+        json.dump({
+            'revision': revision,
+            'timestamp': stamp,
+            'python': platform.python_version(),
+            **(versions or {}),
+            'results': results
+        }, f, indent=2)
+    return path
+
+def previous_results(results_dir):
+    """The most recently saved run, or None"""
+    paths = sorted(glob.glob(os.path.join(results_dir, '*.json')))
+    if not paths:
+        return None
+    with open(paths[-1]) as f:
+        return json.load(f)
+
+def find_regressions(previous, current, tolerance=0.2):
+    """[(name, before, after)] for cases more than tolerance slower than before"""
+    return [
+        (name, previous[name], seconds)
+        for name, seconds in current.items()
+        if name in previous and seconds > previous[name] * (1 + tolerance)
+    ]
+
+def report_regressions(previous, results, tolerance=0.2):
+    """Print the comparison with a previous run; returns the exit status (1 on regression)"""
+    if previous is None:
+        return 0
+    regressions = find_regressions(previous['results'], results, tolerance)
+    print(f"\nCompared with {previous['timestamp']} ({previous['revision']}): "
+          f"{len(regressions)} regression(s)")
+    for name, before, after in regressions:
+        print(f"  ✗ {name}: {before * 1000:.3f} -> {after * 1000:.3f} ms ({after / before:.2f}x)")
+    return 1 if regressions else 0
@@ -0,0 +1,73 @@
+"""
+Benchmarks for the AdherenceAnalyzer report methods.
+
+Every report method is timed at 1k / 100k / 1M rows of generated logs
+(see generate_logs.py), each call on a fresh analyzer so the shared
+aggregation pass is included. Each run is saved to .benchmarks/ as
+JSON, tagged with the git revision, and compared with the previous
+saved run; any case slower than the previous run by more than
+--tolerance is reported as a regression and the exit status is 1.
+
+Usage (from data-analysis/):
+    python benchmark.py [--rows 1000,100000,1000000] [--tolerance 0.2] [--no-save]
+"""
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+from analyze_adherence import AdherenceAnalyzer
+from generate_logs import generate_chunks
+from bench_utils import previous_results, report_regressions, save_results, time_call
+
+ROW_COUNTS = [1_000, 100_000, 1_000_000]
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.benchmarks')
+
+# Report methods timed at every scale, as (name, call on a fresh analyzer)
+REPORT_METHODS = [
+    ('overall_adherence_rate', lambda a: a.overall_adherence_rate()),
+    ('adherence_by_time_of_day', lambda a: a.adherence_by_time_of_day()),
+    ('adherence_by_day_of_week', lambda a: a.adherence_by_day_of_week()),
+    ('user_adherence_ranking', lambda a: a.user_adherence_ranking()),
+    ('medication_adherence_comparison', lambda a: a.medication_adherence_comparison()),
+    ('weekly_trend_analysis', lambda a: a.weekly_trend_analysis()),
+    ('generate_full_report', lambda a: a.generate_full_report())
+]
+
+def generate_logs(n_rows, seed=0):
+    """About n_rows of generated logs: 3 medications x 90 days per user"""
+    n_users = max(1, round(n_rows / (3 * 90)))
+    return pd.concat(generate_chunks(n_users, 3, 90, seed=seed), ignore_index=True)
+
+def run_suite(row_counts=ROW_COUNTS):
+    """Time every report method at every scale; returns {name: seconds per call}"""
+    results = {}
+    print(f"{'case':<44} {'ms/call':>12}")
+    for n in row_counts:
+        df = generate_logs(n)
+        for method, call in REPORT_METHODS:
+            name = f'{method}[{n}]'
+            results[name] = time_call(lambda: call(AdherenceAnalyzer.from_frame(df)))
+            print(f"{name:<44} {results[name] * 1000:>12.3f}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the adherence report methods")
+    parser.add_argument('--rows', default=','.join(map(str, ROW_COUNTS)),
+                        help="comma-separated log sizes")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed slowdown against the previous run (0.2 = 20%%)")
+    parser.add_argument('--no-save', action='store_true', help="do not store this run")
+    args = parser.parse_args()
+    
+    previous = previous_results(RESULTS_DIR)
+    results = run_suite([int(n) for n in args.rows.split(',')])
+    if not args.no_save:
+        versions = {'numpy': np.__version__, 'pandas': pd.__version__}
+        path = save_results(results, RESULTS_DIR, versions)
+        print(f"\n✓ Results saved to {path}")
+    return report_regressions(previous, results, args.tolerance)
+
+if __name__ == "__main__":
+    sys.exit(main())
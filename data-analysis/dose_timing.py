@@ -0,0 +1,176 @@
+"""
+Dose timing: how late taken doses are.
+
+The delay of a taken dose is taken_time - scheduled_time (negative if
+taken early). Missed doses and doses without a taken_time have no delay
+and are left out. For each grouping (overall, user, medication, hour,
+weekday) DelayCounts keeps how many doses had each (group, delay in
+seconds), sorted by that pair. They are folded chunk by chunk with the
+other LogAggregates and saved with the materialized aggregates, so the
+report needs no pass over the log. Log timestamps have whole-second
+resolution, so the counts lose nothing. Percentiles and histograms for
+every group come from array operations over the sorted counts instead
+of a loop over groups.
+"""
+import numpy as np
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Doses taken more than this many minutes after the scheduled time are late
+LATE_AFTER_MINUTES = 30
+
+QUANTILES = (0.5, 0.9, 0.95)
+
+# Histogram bin edges (minutes); the first and last bins are open-ended
+DELAY_BIN_EDGES = np.array([-60, -30, -15, 0, 15, 30, 60, 120, 240])
+
+def bin_labels(edges=DELAY_BIN_EDGES):
+    """Readable label per histogram bin, e.g. '<-60', '0 to 15', '>=240'"""
+    edges = [int(edge) for edge in edges]
+    return ([f'<{edges[0]}'] + [f'{lo} to {hi}' for lo, hi in zip(edges[:-1], edges[1:])]
+            + [f'>={edges[-1]}'])
+
+# Groupings of the report besides 'overall'; names map codes to labels
+GROUPINGS = [('by_user', None), ('by_medication', None), ('by_hour', None),
+             ('by_day_of_week', DAY_NAMES)]
+
+# Sort key: group code in the high 32 bits, delay in seconds (offset so
+# early doses stay non-negative) in the low 32 bits
+DELAY_BITS = 32
+DELAY_OFFSET = 2 ** 31
+
+def _encode(codes, seconds):
+    seconds = np.clip(seconds, -DELAY_OFFSET, DELAY_OFFSET - 1)
+    return (codes.astype(np.int64) << DELAY_BITS) | (seconds.astype(np.int64) + DELAY_OFFSET)
+
+def _decode(keys):
+    return keys >> DELAY_BITS, (keys & (2 ** DELAY_BITS - 1)) - DELAY_OFFSET
+
+def delay_seconds(scheduled, taken_time, taken):
+    """Delay in whole seconds of each taken dose with both timestamps, and the mask of those rows"""
+    scheduled = np.asarray(scheduled, dtype='datetime64[ns]')
+    taken_time = np.asarray(taken_time, dtype='datetime64[ns]')
+    timed = taken & ~np.isnat(scheduled) & ~np.isnat(taken_time)
+    delays = (taken_time[timed] - scheduled[timed]) / np.timedelta64(1, 's')
+    return np.rint(delays).astype(np.int64), timed
+
+class DelayCounts:
+    """Running count of taken doses per (group code, delay in seconds), kept sorted"""
+    
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+    
+    def add(self, codes, seconds):
+        """Fold one chunk: codes are integer group codes (negative skipped), seconds the delays"""
+        valid = codes >= 0
+        if not valid.any():
+            return
+        chunk_keys, counts = np.unique(_encode(codes[valid], seconds[valid]), return_counts=True)
+        
+        # Both key arrays are sorted, so the stable sort is a linear merge
+        keys = np.concatenate([self.keys, chunk_keys])
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        self.keys = keys[starts]
+        self.counts = np.add.reduceat(np.concatenate([self.counts, counts])[order], starts)
+    
+    def table(self, n_groups, quantiles=QUANTILES, late_after=LATE_AFTER_MINUTES):
+        """group_timing() of the folded delays for group codes [0, n_groups)"""
+        codes, seconds = _decode(self.keys)
+        return group_timing(codes, seconds / 60, n_groups, quantiles, late_after,
+                            counts=self.counts)
+
+def group_timing(codes, delays, n_groups, quantiles=QUANTILES,
+                 late_after=LATE_AFTER_MINUTES, edges=DELAY_BIN_EDGES, counts=None):
+    """
+    Timing statistics per group code in [0, n_groups), as arrays indexed by code.
+    
+    delays are in minutes; counts is the number of doses with each
+    (code, delay), one each by default. Quantiles interpolate linearly
+    between order statistics, like np.percentile's default, and are NaN
+    for groups without delays.
+    """
+    if counts is None:
+        counts = np.ones(len(delays), dtype=np.int64)
+    is_late = delays > late_after
+    doses = np.bincount(codes, weights=counts, minlength=n_groups).astype(np.int64)
+    late = np.bincount(codes[is_late], weights=counts[is_late], minlength=n_groups).astype(np.int64)
+    total_delay = np.bincount(codes, weights=delays * counts, minlength=n_groups)
+    
+    # One sort puts every group's delays in a contiguous ascending block;
+    # the k-th order statistic is the entry whose running count passes k
+    order = np.lexsort((delays, codes))
+    ordered = delays[order]
+    passed = np.cumsum(counts[order])
+    starts = np.cumsum(doses) - doses
+    last = np.maximum(doses - 1, 0)
+    positions = starts[:, None] + np.asarray(quantiles)[None, :] * last[:, None]
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, (starts + doses - 1)[:, None])
+    fraction = positions - lower
+    values = np.full(positions.shape, np.nan)
+    has_doses = doses > 0
+    if len(ordered):
+        low = ordered[np.searchsorted(passed, lower[has_doses], side='right')]
+        high = ordered[np.searchsorted(passed, upper[has_doses], side='right')]
+        values[has_doses] = low * (1 - fraction[has_doses]) + high * fraction[has_doses]
+    
+    n_bins = len(edges) + 1
+    bins = np.searchsorted(edges, delays, side='right')
+    histogram = np.bincount(codes * n_bins + bins, weights=counts, minlength=n_groups * n_bins)
+    
+    mean = np.full(n_groups, np.nan)
+    np.divide(total_delay, doses, out=mean, where=has_doses)
+    return {
+        'doses': doses,
+        'late': late,
+        'mean': mean,
+        'quantiles': values,
+        'histogram': histogram.astype(np.int64).reshape(n_groups, n_bins)
+    }
+
+def _round(value):
+    return None if np.isnan(value) else round(float(value), 1)
+
+def _entry(table, i, quantiles):
+    """JSON-friendly timing fields for group i of a group_timing() result"""
+    doses, late = int(table['doses'][i]), int(table['late'][i])
+    return {
+        'doses': doses,
+        'late': late,
+        'late_rate': round(late / doses * 100, 2) if doses else 0,
+        'mean_delay': _round(table['mean'][i]),
+        **{f'p{round(q * 100)}': _round(value)
+           for q, value in zip(quantiles, table['quantiles'][i])},
+        'histogram': table['histogram'][i].tolist()
+    }
+
+def timing_report(delays, labels, late_after=LATE_AFTER_MINUTES, quantiles=QUANTILES):
+    """
+    Delay distribution overall and per user, medication, hour of day and
+    day of week, from the DelayCounts of each grouping in delays. labels
+    gives each grouping's label per group code; groupings without labels
+    are left out, and groups are listed in label order. Each entry has
+    doses (taken doses with a delay), late (more than late_after minutes
+    after schedule), late_rate (%), mean_delay, percentiles in minutes and
+    histogram counts per bin of bin_labels().
+    """
+    report = {
+        'late_after_minutes': late_after,
+        'bins': bin_labels(),
+        'overall': _entry(delays['overall'].table(1, quantiles, late_after), 0, quantiles)
+    }
+    
+    for key, names in GROUPINGS:
+        group_labels = labels.get(key)
+        if not group_labels:
+            continue
+        table = delays[key].table(len(group_labels), quantiles, late_after)
+        present = sorted(np.flatnonzero(table['doses']).tolist(), key=lambda i: group_labels[i])
+        report[key] = {
+            (names[group_labels[i]] if names else str(group_labels[i])): _entry(table, i, quantiles)
+            for i in present
+        }
+    return report
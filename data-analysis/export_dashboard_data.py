@@ -1,16 +1,43 @@
 import json
+import os
+import time
 from analyze_adherence import AdherenceAnalyzer
+from log_store import LogStore, pa
+from materialized import MaterializedAggregates
 
-# Generate comprehensive data for mobile app dashboard
-analyzer = AdherenceAnalyzer()
-report = analyzer.generate_full_report()
+# Read from the Parquet log store if there is one
+# (python log_store.py import adherence_logs.csv), else from the CSV
+store = LogStore() if pa is not None else None
+source = store.root if store is not None and store.exists() else 'adherence_logs.csv'
+if not os.path.exists(source):
+    AdherenceAnalyzer(source)  # Writes sample data
+
+# Fold only the logs added since the last export into the saved aggregates
+# (python materialized.py rebuild recomputes them from scratch)
+materialized = MaterializedAggregates(source)
+aggregates = materialized.refresh()
+refresh = materialized.last_refresh
+print(f"✓ Aggregates {refresh['mode']}: {refresh['new_rows']} new of "
+      f"{refresh['total_rows']} records in {refresh['ms']} ms")
+
+start = time.perf_counter()
+analyzer = AdherenceAnalyzer.from_aggregates(aggregates)
+
+# Generate data for mobile app dashboard
+report = {
+    'overall_adherence': analyzer.overall_adherence_rate(),
+    'by_day_of_week': analyzer.adherence_by_day_of_week(),
+    'by_time_of_day': analyzer.adherence_by_time_of_day(),
+    'streak': analyzer.overall_streak()
+}
 
 # Create simplified dashboard data
 dashboard_data = {
     'summary': {
         'adherence_rate': report['overall_adherence']['adherence_rate'],
         'total_doses': report['overall_adherence']['total_doses'],
-        'streak_days': 7  # Calculate this from consecutive days
+        'streak_days': report['streak']['current_streak'],
+        'longest_streak_days': report['streak']['longest_streak']
     },
     'weekly_progress': [
         {'day': 'Mon', 'rate': report['by_day_of_week'].get('Monday', {}).get('rate', 0)},
@@ -28,5 +55,8 @@ dashboard_data = {
 with open('outputs/dashboard_data.json', 'w') as f:
     json.dump(dashboard_data, f, indent=2)
 
-print("✓ Dashboard data exported")
-print(json.dumps(dashboard_data, indent=2))
\ No newline at end of file
+# The full report, dose timing included, comes from the same aggregates
+analyzer.export_report_json('outputs/analysis_report.json')
+
+print(f"✓ Dashboard data exported in {(time.perf_counter() - start) * 1000:.1f} ms")
+print(json.dumps(dashboard_data, indent=2))
@@ -0,0 +1,172 @@
+"""
+Synthetic adherence logs for load testing.
+
+Generates N users x M medications x D days of logs (one scheduled dose
+per medication per day) with the same columns as adherence_logs.csv.
+Rows are built a block of users at a time with NumPy, and each block is
+written as soon as it is built, so 10M+ row files need only one block
+in memory. Output depends only on the seed and the parameters.
+
+Usage:
+    python generate_logs.py --users 10000 --medications 3 --days 365 --out load_logs.csv
+    python generate_logs.py --users 10000 --days 365 --out load_logs.parquet
+
+Parquet output requires pyarrow.
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+# Dose hours and how often each is used, as in the analyzer's sample data
+DOSE_HOURS = [8, 13, 20]
+DOSE_HOUR_WEIGHTS = [0.4, 0.3, 0.3]
+
+DEFAULT_EFFECTS = {
+    'baseline': 0.75,       # mean per-user probability of taking a dose
+    'baseline_sd': 0.1,     # spread of the per-user baseline
+    'weekend': -0.15,       # added on Saturday and Sunday
+    'hours': {8: 0.1}       # added per dose hour
+}
+
+def user_id_labels(n_users):
+    return [f'user_{i}' for i in range(1, n_users + 1)]
+
+def generate_chunks(n_users=1000, n_medications=3, n_days=90, seed=42,
+                    start='2024-01-01', effects=None, chunk_rows=1_000_000,
+                    medication_pool=None):
+    """
+    Yield DataFrames of synthetic logs, about chunk_rows rows each.
+    
+    Every user takes n_medications distinct medications out of
+    medication_pool (default 4 x n_medications), each at one dose hour
+    drawn from DOSE_HOURS. A dose is taken with probability
+    baseline (per user) + weekend effect + hour effect, clipped to [0, 1].
+    Taken doses are logged 30 minutes early to 2 hours late.
+    
+    Each block of users gets its own generator spawned from the seed, so
+    the output is the same for the same seed and parameters.
+    """
+    effects = {**DEFAULT_EFFECTS, **(effects or {})}
+    medication_pool = medication_pool or 4 * n_medications
+    if n_medications > medication_pool:
+        raise ValueError("n_medications cannot exceed medication_pool")
+    
+    users_per_chunk = max(1, chunk_rows // (n_medications * n_days))
+    n_chunks = -(-n_users // users_per_chunk)
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    
+    user_dtype = pd.CategoricalDtype(user_id_labels(n_users))
+    med_dtype = pd.CategoricalDtype([f'med_{i}' for i in range(1, medication_pool + 1)])
+    status_dtype = pd.CategoricalDtype(['missed', 'taken'])
+    
+    hour_effect = np.zeros(24)
+    for hour, effect in effects['hours'].items():
+        hour_effect[int(hour)] = effect
+    
+    start = np.datetime64(pd.Timestamp(start).floor('D').to_datetime64(), 's')
+    days = start + np.arange(n_days).astype('timedelta64[D]')
+    # 1970-01-01 was a Thursday; Monday = 0 as in pandas dayofweek
+    day_of_week = (days.astype('datetime64[D]').astype(np.int64) + 3) % 7
+    
+    for chunk, chunk_seed in enumerate(seeds):
+        rng = np.random.default_rng(chunk_seed)
+        first_user = chunk * users_per_chunk
+        k = min(users_per_chunk, n_users - first_user)
+        shape = (k, n_medications, n_days)
+        
+        baseline = rng.normal(effects['baseline'], effects['baseline_sd'], k)
+        # Distinct medications per user: first n_medications of a random permutation
+        medications = rng.random((k, medication_pool)).argsort(axis=1)[:, :n_medications]
+        hours = rng.choice(DOSE_HOURS, size=(k, n_medications), p=DOSE_HOUR_WEIGHTS)
+        
+        user = np.broadcast_to((first_user + np.arange(k))[:, None, None], shape).ravel()
+        medication = np.broadcast_to(medications[:, :, None], shape).ravel()
+        hour = np.broadcast_to(hours[:, :, None], shape).ravel()
+        day = np.broadcast_to(np.arange(n_days), shape).ravel()
+        dow = day_of_week[day]
+        
+        p = (baseline[user - first_user]
+             + effects['weekend'] * (dow >= 5)
+             + hour_effect[hour])
+        taken = rng.random(len(user)) < np.clip(p, 0, 1)
+        
+        scheduled = days[day] + hour.astype('timedelta64[h]')
+        delay = rng.integers(-30, 120, len(user)).astype('timedelta64[m]')
+        taken_time = np.where(taken, scheduled + delay, np.datetime64('NaT'))
+        
+        yield pd.DataFrame({
+            'user_id': pd.Categorical.from_codes(user, dtype=user_dtype),
+            'medication_id': pd.Categorical.from_codes(medication, dtype=med_dtype),
+            'scheduled_time': scheduled.astype('datetime64[ns]'),
+            'taken_time': taken_time.astype('datetime64[ns]'),
+            'status': pd.Categorical.from_codes(taken.astype(np.int8), dtype=status_dtype),
+            'day_of_week': dow.astype(np.int8),
+            'hour_of_day': hour.astype(np.int8)
+        })
+
+def write_logs(path, chunks, file_format=None):
+    """Write generated chunks to a CSV or Parquet file; returns the row count"""
+    file_format = file_format or ('parquet' if path.endswith('.parquet') else 'csv')
+    rows = 0
+    if file_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for df in chunks:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                rows += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        for df in chunks:
+            df.to_csv(path, mode='a' if rows else 'w', header=not rows, index=False)
+            rows += len(df)
+    return rows
+
+def parse_hour_effects(value):
+    """'8:0.1,20:-0.05' -> {8: 0.1, 20: -0.05}"""
+    effects = {}
+    for item in filter(None, value.split(',')):
+        hour, effect = item.split(':')
+        effects[int(hour)] = float(effect)
+    return effects
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic adherence logs")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--medications', type=int, default=3, help="medications per user")
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--start', default='2024-01-01', help="first scheduled day")
+    parser.add_argument('--out', default='generated_logs.csv', help=".csv or .parquet")
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000)
+    parser.add_argument('--baseline', type=float, default=DEFAULT_EFFECTS['baseline'])
+    parser.add_argument('--baseline-sd', type=float, default=DEFAULT_EFFECTS['baseline_sd'])
+    parser.add_argument('--weekend-effect', type=float, default=DEFAULT_EFFECTS['weekend'])
+    parser.add_argument('--hour-effects', type=parse_hour_effects, default=DEFAULT_EFFECTS['hours'],
+                        help="comma-separated hour:effect pairs, e.g. 8:0.1,20:-0.05")
+    args = parser.parse_args()
+    
+    effects = {
+        'baseline': args.baseline,
+        'baseline_sd': args.baseline_sd,
+        'weekend': args.weekend_effect,
+        'hours': args.hour_effects
+    }
+    chunks = generate_chunks(args.users, args.medications, args.days, args.seed,
+                             args.start, effects, args.chunk_rows)
+    
+    start = time.perf_counter()
+    rows = write_logs(args.out, chunks)
+    elapsed = time.perf_counter() - start
+    print(f"✓ Generated {rows} records to {args.out} in {elapsed:.2f}s "
+          f"({rows / elapsed:,.0f} rows/s)")
+
+if __name__ == "__main__":
+    main()
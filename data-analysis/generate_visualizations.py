@@ -1,160 +1,296 @@
 import pandas as pd
+import matplotlib
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
+import hashlib
+import inspect
+import json
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from log_stream import LogAggregates, read_logs
 
 # Set style
 sns.set_style("whitegrid")
 plt.rcParams['figure.figsize'] = (10, 6)
 plt.rcParams['font.size'] = 10
 
+# Preview mode renders SVG at screen resolution for the dashboard pipeline
+PREVIEW_DPI = 72
+
+# Chart file name -> hash of its inputs, kept next to the charts
+CACHE_MANIFEST = '.chart_cache.json'
+
+# Renderers take the small input dict built by AdherenceVisualizer and
+# run in worker processes, so they only use their arguments
+
+def render_overall_adherence(data, path, dpi):
+    """Pie chart of overall adherence"""
+    fig, ax = plt.subplots()
+    colors = ['#4CAF50', '#F44336']
+    ax.pie([data['taken'], data['missed']], labels=['Taken', 'Missed'], autopct='%1.1f%%',
+           colors=colors, startangle=90)
+    ax.set_title('Overall Medication Adherence', fontsize=14, fontweight='bold')
+    
+    plt.savefig(path, dpi=dpi, bbox_inches='tight')
+    plt.close()
+
+def render_time_of_day_adherence(data, path, dpi):
+    """Bar chart of adherence by time of day"""
+    df_time = pd.DataFrame(data['rates'])
+    
+    fig, ax = plt.subplots()
+    bars = ax.bar(df_time['time'], df_time['rate'], color=['#FFC107', '#2196F3', '#9C27B0'])
+    ax.set_ylabel('Adherence Rate (%)', fontweight='bold')
+    ax.set_title('Adherence Rate by Time of Day', fontsize=14, fontweight='bold')
+    ax.set_ylim(0, 100)
+    
+    # Add value labels on bars
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width()/2., height,
+               f'{height:.1f}%', ha='center', va='bottom', fontweight='bold')
+    
+    plt.savefig(path, dpi=dpi, bbox_inches='tight')
+    plt.close()
+
+def render_day_of_week_adherence(data, path, dpi):
+    """Line chart of adherence by day of week"""
+    days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+    adherence_rates = data['rates']
+    
+    fig, ax = plt.subplots()
+    ax.plot(days, adherence_rates, marker='o', linewidth=2, markersize=8, color='#3F51B5')
+    ax.fill_between(range(7), adherence_rates, alpha=0.3, color='#3F51B5')
+    ax.set_ylabel('Adherence Rate (%)', fontweight='bold')
+    ax.set_xlabel('Day of Week', fontweight='bold')
+    ax.set_title('Adherence Rate by Day of Week', fontsize=14, fontweight='bold')
+    ax.set_ylim(0, 100)
+    ax.grid(True, alpha=0.3)
+    
+    # Highlight weekends
+    ax.axvspan(4.5, 6.5, alpha=0.1, color='red', label='Weekend')
+    ax.legend()
+    
+    plt.savefig(path, dpi=dpi, bbox_inches='tight')
+    plt.close()
+
+def render_user_comparison(data, path, dpi):
+    """Bar chart comparing user adherence rates"""
+    df_users = pd.DataFrame(data['rates']).sort_values('rate', ascending=False)
+    
+    fig, ax = plt.subplots(figsize=(12, 6))
+    colors = plt.cm.viridis(np.linspace(0, 1, len(df_users)))
+    bars = ax.barh(df_users['user'], df_users['rate'], color=colors)
+    ax.set_xlabel('Adherence Rate (%)', fontweight='bold')
+    ax.set_title('User Adherence Comparison', fontsize=14, fontweight='bold')
+    ax.set_xlim(0, 100)
+    
+    # Add value labels
+    for i, (bar, rate) in enumerate(zip(bars, df_users['rate'])):
+        ax.text(rate + 1, i, f'{rate:.1f}%', va='center', fontweight='bold')
+    
+    plt.savefig(path, dpi=dpi, bbox_inches='tight')
+    plt.close()
+
+def render_weekly_trends(data, path, dpi):
+    """Line chart of weekly adherence trends"""
+    labels, rates = data['labels'], data['rates']
+    x = np.arange(len(labels))
+    
+    fig, ax = plt.subplots()
+    ax.plot(x, rates, marker='o', linewidth=2.5,
+           markersize=10, color='#E91E63')
+    ax.fill_between(x, rates, alpha=0.3, color='#E91E63')
+    ax.set_xticks(x)
+    ax.set_xticklabels(labels)
+    ax.set_xlabel('ISO Week', fontweight='bold')
+    ax.set_ylabel('Adherence Rate (%)', fontweight='bold')
+    ax.set_title('Weekly Adherence Trends', fontsize=14, fontweight='bold')
+    ax.set_ylim(0, 100)
+    ax.grid(True, alpha=0.3)
+    
+    plt.savefig(path, dpi=dpi, bbox_inches='tight')
+    plt.close()
+
+CHART_RENDERERS = {
+    'overall_adherence': render_overall_adherence,
+    'time_of_day_adherence': render_time_of_day_adherence,
+    'day_of_week_adherence': render_day_of_week_adherence,
+    'user_comparison': render_user_comparison,
+    'weekly_trends': render_weekly_trends
+}
+
+def chart_key(name, data, dpi, image_format):
+    """
+    Content hash of everything a chart depends on: its input data, the
+    output settings, the renderer's source and the matplotlib version.
+    """
+    payload = json.dumps({
+        'chart': name,
+        'data': data,
+        'dpi': dpi,
+        'format': image_format,
+        'renderer': inspect.getsource(CHART_RENDERERS[name]),
+        'matplotlib': matplotlib.__version__
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def render_chart(job):
+    """Render one (name, data, path, dpi) job; the process pool entry point"""
+    name, data, path, dpi = job
+    CHART_RENDERERS[name](data, path, dpi)
+    return os.path.basename(path)
+
 class AdherenceVisualizer:
-    def __init__(self, data_file='adherence_logs.csv'):
-        self.df = pd.read_csv(data_file)
-        self.output_dir = 'outputs/charts'
+    def __init__(self, data_file='adherence_logs.csv', chunksize=None, aggregates=None,
+                 preview=False):
+        """
+        With chunksize set, the log is streamed in chunks of that many rows
+        and only running aggregates are kept (self.df is None). Prebuilt
+        aggregates (e.g. from LogStore.aggregate) can be passed instead.
+        
+        preview=True writes SVGs at PREVIEW_DPI to outputs/charts/preview
+        instead of 300 dpi PNGs, for quick dashboard builds.
+        """
+        if aggregates is not None:
+            self.df = None
+            self.aggregates = aggregates
+        elif chunksize:
+            self.df = None
+            self.aggregates = LogAggregates.from_csv(data_file, chunksize)
+        else:
+            self.df = read_logs(data_file)
+            self.aggregates = LogAggregates.from_frame(self.df)
+        self.preview = preview
+        self.output_dir = 'outputs/charts/preview' if preview else 'outputs/charts'
+        self.image_format = 'svg' if preview else 'png'
+        self.dpi = PREVIEW_DPI if preview else 300
         os.makedirs(self.output_dir, exist_ok=True)
     
-    def plot_overall_adherence(self):
-        """Pie chart of overall adherence"""
-        taken = len(self.df[self.df['status'] == 'taken'])
-        missed = len(self.df[self.df['status'] == 'missed'])
-        
-        fig, ax = plt.subplots()
-        colors = ['#4CAF50', '#F44336']
-        ax.pie([taken, missed], labels=['Taken', 'Missed'], autopct='%1.1f%%',
-               colors=colors, startangle=90)
-        ax.set_title('Overall Medication Adherence', fontsize=14, fontweight='bold')
-        
-        plt.savefig(f'{self.output_dir}/overall_adherence.png', dpi=300, bbox_inches='tight')
-        plt.close()
-        print("✓ Generated: overall_adherence.png")
+    def _overall_adherence_data(self):
+        return {'taken': int(self.aggregates.taken), 'missed': int(self.aggregates.missed)}
     
-    def plot_time_of_day_adherence(self):
-        """Bar chart of adherence by time of day"""
+    def _time_of_day_adherence_data(self):
         time_mapping = {
             8: 'Morning\n(8 AM)',
             13: 'Afternoon\n(1 PM)',
             20: 'Evening\n(8 PM)'
         }
         
+        hour_total = self.aggregates.hour_total
+        hour_taken = self.aggregates.hour_taken
+        
         adherence_by_time = []
         for hour in [8, 13, 20]:
-            hour_data = self.df[self.df['hour_of_day'] == hour]
-            if len(hour_data) > 0:
-                rate = len(hour_data[hour_data['status'] == 'taken']) / len(hour_data) * 100
-                adherence_by_time.append({'time': time_mapping[hour], 'rate': rate})
-        
-        df_time = pd.DataFrame(adherence_by_time)
-        
-        fig, ax = plt.subplots()
-        bars = ax.bar(df_time['time'], df_time['rate'], color=['#FFC107', '#2196F3', '#9C27B0'])
-        ax.set_ylabel('Adherence Rate (%)', fontweight='bold')
-        ax.set_title('Adherence Rate by Time of Day', fontsize=14, fontweight='bold')
-        ax.set_ylim(0, 100)
-        
-        # Add value labels on bars
-        for bar in bars:
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height,
-                   f'{height:.1f}%', ha='center', va='bottom', fontweight='bold')
-        
-        plt.savefig(f'{self.output_dir}/time_of_day_adherence.png', dpi=300, bbox_inches='tight')
-        plt.close()
-        print("✓ Generated: time_of_day_adherence.png")
+            if hour_total[hour] > 0:
+                rate = hour_taken[hour] / hour_total[hour] * 100
+                adherence_by_time.append({'time': time_mapping[hour], 'rate': float(rate)})
+        return {'rates': adherence_by_time}
     
-    def plot_day_of_week_adherence(self):
-        """Line chart of adherence by day of week"""
-        days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+    def _day_of_week_adherence_data(self):
+        day_total = self.aggregates.day_total
+        day_taken = self.aggregates.day_taken
         adherence_rates = []
         
         for day_num in range(7):
-            day_data = self.df[self.df['day_of_week'] == day_num]
-            if len(day_data) > 0:
-                rate = len(day_data[day_data['status'] == 'taken']) / len(day_data) * 100
-                adherence_rates.append(rate)
+            if day_total[day_num] > 0:
+                rate = day_taken[day_num] / day_total[day_num] * 100
+                adherence_rates.append(float(rate))
             else:
                 adherence_rates.append(0)
+        return {'rates': adherence_rates}
+    
+    def _user_comparison_data(self, top_n=10):
+        users, totals, takens = self.aggregates.users.counts()
+        user_rates = []
+        for i, user_id in enumerate(users[:top_n]):
+            rate = takens[i] / totals[i] * 100
+            user_rates.append({'user': str(user_id), 'rate': float(rate)})
+        return {'rates': user_rates}
+    
+    def _weekly_trends_data(self):
+        weekly = self.aggregates.daily.resample('W')
+        df_weekly = weekly[weekly['total'] > 0].tail(8)  # Last 8 weeks with doses
+        return {
+            'labels': [f"{year}-W{week:02d}" for year, week in zip(df_weekly['iso_year'], df_weekly['week'])],
+            'rates': df_weekly['rate'].tolist()
+        }
+    
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.output_dir, CACHE_MANIFEST)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+    
+    def _save_manifest(self, manifest):
+        with open(os.path.join(self.output_dir, CACHE_MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    
+    def render(self, chart_data, workers=1):
+        """
+        Render charts from {name: input data}, skipping any whose inputs
+        hash to the same key as the file already on disk. With workers > 1
+        the remaining charts are rendered in a process pool.
+        """
+        manifest = self._load_manifest()
+        jobs, keys = [], {}
+        for name, data in chart_data.items():
+            filename = f"{name}.{self.image_format}"
+            path = os.path.join(self.output_dir, filename)
+            key = chart_key(name, data, self.dpi, self.image_format)
+            if manifest.get(filename) == key and os.path.exists(path):
+                print(f"✓ Unchanged: {filename}")
+                continue
+            jobs.append((name, data, path, self.dpi))
+            keys[filename] = key
         
-        fig, ax = plt.subplots()
-        ax.plot(days, adherence_rates, marker='o', linewidth=2, markersize=8, color='#3F51B5')
-        ax.fill_between(range(7), adherence_rates, alpha=0.3, color='#3F51B5')
-        ax.set_ylabel('Adherence Rate (%)', fontweight='bold')
-        ax.set_xlabel('Day of Week', fontweight='bold')
-        ax.set_title('Adherence Rate by Day of Week', fontsize=14, fontweight='bold')
-        ax.set_ylim(0, 100)
-        ax.grid(True, alpha=0.3)
-        
-        # Highlight weekends
-        ax.axvspan(4.5, 6.5, alpha=0.1, color='red', label='Weekend')
-        ax.legend()
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+                rendered = list(pool.map(render_chart, jobs))
+        else:
+            rendered = [render_chart(job) for job in jobs]
         
-        plt.savefig(f'{self.output_dir}/day_of_week_adherence.png', dpi=300, bbox_inches='tight')
-        plt.close()
-        print("✓ Generated: day_of_week_adherence.png")
+        for filename in rendered:
+            manifest[filename] = keys[filename]
+            print(f"✓ Generated: {filename}")
+        self._save_manifest(manifest)
+        return rendered
+    
+    def plot_overall_adherence(self):
+        """Pie chart of overall adherence"""
+        self.render({'overall_adherence': self._overall_adherence_data()})
+    
+    def plot_time_of_day_adherence(self):
+        """Bar chart of adherence by time of day"""
+        self.render({'time_of_day_adherence': self._time_of_day_adherence_data()})
+    
+    def plot_day_of_week_adherence(self):
+        """Line chart of adherence by day of week"""
+        self.render({'day_of_week_adherence': self._day_of_week_adherence_data()})
     
     def plot_user_comparison(self, top_n=10):
         """Bar chart comparing user adherence rates"""
-        user_rates = []
-        for user_id in self.df['user_id'].unique()[:top_n]:
-            user_data = self.df[self.df['user_id'] == user_id]
-            rate = len(user_data[user_data['status'] == 'taken']) / len(user_data) * 100
-            user_rates.append({'user': user_id, 'rate': rate})
-        
-        df_users = pd.DataFrame(user_rates).sort_values('rate', ascending=False)
-        
-        fig, ax = plt.subplots(figsize=(12, 6))
-        colors = plt.cm.viridis(np.linspace(0, 1, len(df_users)))
-        bars = ax.barh(df_users['user'], df_users['rate'], color=colors)
-        ax.set_xlabel('Adherence Rate (%)', fontweight='bold')
-        ax.set_title('User Adherence Comparison', fontsize=14, fontweight='bold')
-        ax.set_xlim(0, 100)
-        
-        # Add value labels
-        for i, (bar, rate) in enumerate(zip(bars, df_users['rate'])):
-            ax.text(rate + 1, i, f'{rate:.1f}%', va='center', fontweight='bold')
-        
-        plt.savefig(f'{self.output_dir}/user_comparison.png', dpi=300, bbox_inches='tight')
-        plt.close()
-        print("✓ Generated: user_comparison.png")
+        self.render({'user_comparison': self._user_comparison_data(top_n)})
     
     def plot_weekly_trends(self):
         """Line chart of weekly adherence trends"""
-        self.df['scheduled_time'] = pd.to_datetime(self.df['scheduled_time'])
-        self.df['week'] = self.df['scheduled_time'].dt.isocalendar().week
-        
-        weekly_rates = []
-        for week in sorted(self.df['week'].unique())[-8:]:  # Last 8 weeks
-            week_data = self.df[self.df['week'] == week]
-            rate = len(week_data[week_data['status'] == 'taken']) / len(week_data) * 100
-            weekly_rates.append({'week': week, 'rate': rate})
-        
-        df_weekly = pd.DataFrame(weekly_rates)
-        
-        fig, ax = plt.subplots()
-        ax.plot(df_weekly['week'], df_weekly['rate'], marker='o', linewidth=2.5, 
-               markersize=10, color='#E91E63')
-        ax.fill_between(df_weekly['week'], df_weekly['rate'], alpha=0.3, color='#E91E63')
-        ax.set_xlabel('Week Number', fontweight='bold')
-        ax.set_ylabel('Adherence Rate (%)', fontweight='bold')
-        ax.set_title('Weekly Adherence Trends', fontsize=14, fontweight='bold')
-        ax.set_ylim(0, 100)
-        ax.grid(True, alpha=0.3)
-        
-        plt.savefig(f'{self.output_dir}/weekly_trends.png', dpi=300, bbox_inches='tight')
-        plt.close()
-        print("✓ Generated: weekly_trends.png")
+        self.render({'weekly_trends': self._weekly_trends_data()})
     
-    def generate_all_visualizations(self):
-        """Generate all visualization charts"""
+    def generate_all_visualizations(self, workers=None):
+        """Generate all visualization charts, in parallel across workers processes"""
         print("\nGenerating visualizations...")
         print("-" * 40)
         
-        self.plot_overall_adherence()
-        self.plot_time_of_day_adherence()
-        self.plot_day_of_week_adherence()
-        self.plot_user_comparison()
-        self.plot_weekly_trends()
+        self.render({
+            'overall_adherence': self._overall_adherence_data(),
+            'time_of_day_adherence': self._time_of_day_adherence_data(),
+            'day_of_week_adherence': self._day_of_week_adherence_data(),
+            'user_comparison': self._user_comparison_data(),
+            'weekly_trends': self._weekly_trends_data()
+        }, workers or os.cpu_count())
         
         print("-" * 40)
         print(f"✓ All charts saved to {self.output_dir}/")
@@ -162,5 +298,5 @@ class AdherenceVisualizer:
 
 # Main execution
 if __name__ == "__main__":
-    visualizer = AdherenceVisualizer()
+    visualizer = AdherenceVisualizer(preview='--preview' in sys.argv)
     visualizer.generate_all_visualizations()
\ No newline at end of file
@@ -0,0 +1,209 @@
+"""
+Columnar Parquet store for adherence logs.
+
+Logs are imported once from CSV and written as Parquet files partitioned
+by month and user bucket (hive layout: month=2024-07/user_bucket=3/).
+Queries read only the requested columns, skip partitions outside the
+date range or user set, and memory-map the files they do read.
+
+Usage:
+    python log_store.py import adherence_logs.csv [log_store]
+
+Requires pyarrow.
+"""
+import os
+import shutil
+import sys
+import uuid
+import zlib
+import numpy as np
+import pandas as pd
+from log_stream import LogAggregates, read_log_chunks
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+except ImportError:
+    pa = None
+
+if pa is not None:
+    STORE_SCHEMA = pa.schema([
+        ('user_id', pa.string()),
+        ('medication_id', pa.string()),
+        ('scheduled_time', pa.timestamp('ns')),
+        ('taken_time', pa.timestamp('ns')),
+        ('status', pa.string()),
+        ('day_of_week', pa.int8()),
+        ('hour_of_day', pa.int8())
+    ])
+
+DEFAULT_STORE = 'log_store'
+USER_BUCKETS = 8
+# Large row groups keep scans fast; write_dataset's default follows the
+# (small) incoming batches
+ROW_GROUP_ROWS = 1 << 17
+
+def user_bucket(user_ids, n_buckets=USER_BUCKETS):
+    """Stable partition bucket for each user ID (crc32, not Python's salted hash)"""
+    codes, uniques = pd.factorize(pd.Series(user_ids).astype(str))
+    buckets = np.array([zlib.crc32(u.encode()) % n_buckets for u in uniques], dtype=np.int16)
+    return buckets[codes]
+
+class LogStore:
+    def __init__(self, root=DEFAULT_STORE, n_user_buckets=USER_BUCKETS):
+        if pa is None:
+            raise ImportError("LogStore requires pyarrow (pip install pyarrow)")
+        self.root = root
+        self.n_user_buckets = n_user_buckets
+        self._partitioning = ds.partitioning(
+            pa.schema([('month', pa.string()), ('user_bucket', pa.int16())]),
+            flavor='hive'
+        )
+    
+    def exists(self):
+        return os.path.isdir(self.root) and any(os.scandir(self.root))
+    
+    def import_csv(self, csv_path, chunksize=500_000):
+        """Convert a log CSV into the store; returns the number of rows written"""
+        rows = 0
+        for chunk in read_log_chunks(csv_path, chunksize):
+            self.append(chunk)
+            rows += len(chunk)
+        self.compact()
+        return rows
+    
+    def append(self, df):
+        """Write a DataFrame of log rows as new Parquet files in their partitions"""
+        df = df[list(STORE_SCHEMA.names)].copy()
+        for col in ['scheduled_time', 'taken_time']:
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = pd.to_datetime(df[col])
+        # Plain strings on disk (Parquet dictionary-encodes them); per-chunk
+        # categoricals would give each file a different dictionary type
+        for col in ['user_id', 'medication_id', 'status']:
+            df[col] = df[col].astype('string')
+        
+        table = pa.Table.from_pandas(df, schema=STORE_SCHEMA, preserve_index=False)
+        table = table.append_column(
+            'month', pa.array(df['scheduled_time'].dt.strftime('%Y-%m'), pa.string()))
+        table = table.append_column(
+            'user_bucket', pa.array(user_bucket(df['user_id'], self.n_user_buckets), pa.int16()))
+        ds.write_dataset(
+            table, self.root,
+            format='parquet',
+            partitioning=self._partitioning,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore',
+            min_rows_per_group=ROW_GROUP_ROWS,
+            max_rows_per_group=ROW_GROUP_ROWS * 8
+        )
+    
+    def compact(self):
+        """
+        Rewrite each month as one file per partition. Every append adds
+        files, so run this after a bulk import or a series of appends.
+        """
+        dataset = self._dataset()
+        months = sorted(entry.name[len('month='):] for entry in os.scandir(self.root)
+                        if entry.name.startswith('month=') and entry.is_dir())
+        for month in months:
+            month_dir = os.path.join(self.root, f"month={month}")
+            table = dataset.to_table(filter=ds.field('month') == month).drop_columns(['month'])
+            staging = f"{month_dir}.compacting"
+            ds.write_dataset(
+                table, staging,
+                format='parquet',
+                partitioning=ds.partitioning(pa.schema([('user_bucket', pa.int16())]), flavor='hive'),
+                basename_template="part-{i}.parquet",
+                existing_data_behavior='delete_matching',
+                min_rows_per_group=ROW_GROUP_ROWS,
+                max_rows_per_group=ROW_GROUP_ROWS * 8
+            )
+            shutil.rmtree(month_dir)
+            os.rename(staging, month_dir)
+    
+    def _dataset(self, files=None):
+        filesystem = pafs.LocalFileSystem(use_mmap=True)
+        if files is not None:
+            return ds.dataset(files, format='parquet', partitioning=self._partitioning,
+                              partition_base_dir=self.root, filesystem=filesystem)
+        return ds.dataset(self.root, format='parquet', partitioning=self._partitioning,
+                          filesystem=filesystem)
+    
+    def files(self):
+        """Paths of the store's Parquet files"""
+        return self._dataset().files
+    
+    def _filter(self, start=None, end=None, user_ids=None):
+        """Partition filters (month, user_bucket) plus the matching row filters"""
+        conditions = []
+        if start is not None:
+            start = pd.Timestamp(start)
+            conditions.append(ds.field('month') >= start.strftime('%Y-%m'))
+            conditions.append(ds.field('scheduled_time') >= start)
+        if end is not None:
+            end = pd.Timestamp(end)
+            conditions.append(ds.field('month') <= end.strftime('%Y-%m'))
+            conditions.append(ds.field('scheduled_time') < end)
+        if user_ids is not None:
+            user_ids = [str(u) for u in user_ids]
+            buckets = sorted(set(user_bucket(user_ids, self.n_user_buckets).tolist()))
+            conditions.append(ds.field('user_bucket').isin(buckets))
+            conditions.append(ds.field('user_id').isin(user_ids))
+        
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+    
+    def iter_batches(self, columns=None, start=None, end=None, user_ids=None,
+                     batch_size=500_000, files=None):
+        """
+        Yield DataFrames of matching rows. Only the given columns are read,
+        and partitions outside [start, end) or the user set are skipped.
+        Pass files (from files()) to read only those files.
+        """
+        scanner = self._dataset(files).scanner(
+            columns=columns,
+            filter=self._filter(start, end, user_ids),
+            batch_size=batch_size
+        )
+        # Files are small (one per partition per import), so regroup their
+        # record batches into batch_size-row frames before converting
+        pending, rows = [], 0
+        for batch in scanner.to_batches():
+            if batch.num_rows:
+                pending.append(batch)
+                rows += batch.num_rows
+            if rows >= batch_size:
+                yield pa.Table.from_batches(pending).to_pandas(strings_to_categorical=True)
+                pending, rows = [], 0
+        if pending:
+            yield pa.Table.from_batches(pending).to_pandas(strings_to_categorical=True)
+    
+    def query(self, columns=None, start=None, end=None, user_ids=None):
+        """All matching rows as one DataFrame"""
+        table = self._dataset().to_table(columns=columns,
+                                         filter=self._filter(start, end, user_ids))
+        return table.to_pandas(strings_to_categorical=True)
+    
+    def aggregate(self, columns=None, start=None, end=None, user_ids=None):
+        """
+        LogAggregates over matching rows, streamed batch by batch. Rows
+        arrive in partition order, so users are listed in that order rather
+        than in CSV order (only ties in the rankings differ).
+        """
+        aggregates = LogAggregates()
+        for batch in self.iter_batches(columns, start, end, user_ids):
+            aggregates.fold(batch)
+        return aggregates
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != 'import':
+        print("Usage: python log_store.py import <logs.csv> [store_dir]")
+        sys.exit(1)
+    
+    store = LogStore(sys.argv[3] if len(sys.argv) > 3 else DEFAULT_STORE)
+    rows = store.import_csv(sys.argv[2])
+    print(f"✓ Imported {rows} records into {store.root}/")
@@ -0,0 +1,360 @@
+import numpy as np
+import pandas as pd
+from streaks import DoseDays
+from dose_timing import LATE_AFTER_MINUTES, DelayCounts, delay_seconds, timing_report
+
+# Compact dtypes for the adherence log columns
+LOG_DTYPES = {
+    'user_id': 'category',
+    'medication_id': 'category',
+    'status': 'category',
+    'day_of_week': 'int8',
+    'hour_of_day': 'int8'
+}
+DATE_COLUMNS = ['scheduled_time', 'taken_time']
+
+# Time of day buckets used by the report: 0 Morning (6-11), 1 Afternoon (12-17), 2 Evening (18-23)
+HOUR_TO_BUCKET = np.array([-1] * 6 + [0] * 6 + [1] * 6 + [2] * 6)
+
+# Columns LogAggregates folds
+AGGREGATE_COLUMNS = ['user_id', 'medication_id', 'scheduled_time', 'taken_time', 'status',
+                     'day_of_week', 'hour_of_day']
+
+# Groupings of the dose delays (see dose_timing.DelayCounts)
+DELAY_GROUPINGS = ['overall', 'by_user', 'by_medication', 'by_hour', 'by_day_of_week']
+
+def _read_options(columns=None):
+    """read_csv arguments for the compact layout, limited to columns if given"""
+    return {
+        'usecols': columns,
+        'dtype': {col: kind for col, kind in LOG_DTYPES.items() if columns is None or col in columns},
+        'parse_dates': [col for col in DATE_COLUMNS if columns is None or col in columns]
+    }
+
+def read_log_chunks(path, chunksize=500_000, columns=None, names=None):
+    """
+    Iterate over an adherence log CSV in chunks of chunksize rows, with
+    categorical IDs/status, int8 hour/day and parsed datetime64 timestamps.
+    Pass columns to read only those columns. path may be an open binary
+    file; pass names if it is positioned after the header line.
+    """
+    return pd.read_csv(path, names=names, header=None if names else 'infer',
+                       chunksize=chunksize, **_read_options(columns))
+
+def read_logs(path, columns=None):
+    """
+    A whole adherence log CSV in the compact layout: IDs and status
+    dictionary-encoded as categoricals (int8/int16 codes), int8 hour and
+    day, datetime64 timestamps. Parsed once here, so no report method
+    needs to convert columns later.
+    """
+    return pd.read_csv(path, **_read_options(columns))
+
+def compact_logs(df):
+    """Convert a log DataFrame from any source to the read_logs() layout"""
+    converted = {}
+    for col, kind in LOG_DTYPES.items():
+        if col in df.columns and df[col].dtype != kind:
+            converted[col] = df[col].astype(kind)
+    for col in DATE_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            converted[col] = pd.to_datetime(df[col])
+    return df.assign(**converted) if converted else df
+
+def memory_footprint(df):
+    """Bytes held by each column (including string contents) and in total"""
+    usage = df.memory_usage(deep=True, index=False)
+    return {'columns': {col: int(size) for col, size in usage.items()},
+            'total': int(usage.sum())}
+
+class GroupCounter:
+    """Running total/taken dose counts per label, labels kept in first-seen order"""
+    
+    def __init__(self):
+        self._index = {}
+        self.labels = []
+        self.total = np.zeros(0, dtype=np.int64)
+        self.taken = np.zeros(0, dtype=np.int64)
+    
+    def add(self, values, taken):
+        """
+        Fold one chunk: values are the group labels, taken a boolean mask.
+        Returns each row's global label index (-1 for missing labels).
+        """
+        codes, uniques = pd.factorize(values)
+        
+        # Map this chunk's codes onto the global label order
+        chunk_to_global = np.empty(len(uniques), dtype=np.int64)
+        for i, label in enumerate(uniques):
+            index = self._index.get(label)
+            if index is None:
+                index = self._index[label] = len(self.labels)
+                self.labels.append(label)
+            chunk_to_global[i] = index
+        
+        n = len(self.labels)
+        if n > len(self.total):
+            self.total = np.concatenate([self.total, np.zeros(n - len(self.total), dtype=np.int64)])
+            self.taken = np.concatenate([self.taken, np.zeros(n - len(self.taken), dtype=np.int64)])
+        
+        valid = codes >= 0
+        groups = chunk_to_global[codes[valid]]
+        self.total += np.bincount(groups, minlength=n)
+        self.taken += np.bincount(groups[taken[valid]], minlength=n)
+        global_codes = np.full(len(codes), -1, dtype=np.int64)
+        global_codes[valid] = groups
+        return global_codes
+    
+    def counts(self):
+        """(labels, total, taken) arrays in first-seen label order"""
+        return self.labels, self.total, self.taken
+
+# resample() frequencies: ISO weeks run Monday to Sunday and are labelled by their Monday
+RESAMPLE_RULES = {
+    'D': dict(rule='D'),
+    'W': dict(rule='W-MON', closed='left', label='left'),
+    'M': dict(rule='MS')
+}
+
+class DailyCounts:
+    """
+    Running total/taken dose counts per calendar day of scheduled_time.
+    
+    This is the time index for every periodic view: weeks, months and
+    rolling windows are resampled from the daily counts, so none of them
+    needs another pass over the log. Days are kept sorted.
+    """
+    
+    def __init__(self):
+        self.days = np.zeros(0, dtype='datetime64[D]')
+        self.total = np.zeros(0, dtype=np.int64)
+        self.taken = np.zeros(0, dtype=np.int64)
+    
+    def add(self, days, taken):
+        """Fold one chunk: days a datetime64[D] array (NaT skipped), taken a boolean mask"""
+        valid = ~np.isnat(days)
+        if not valid.any():
+            return
+        day_numbers = days[valid].astype(np.int64)
+        first = day_numbers.min()
+        offsets = day_numbers - first
+        total = np.bincount(offsets)
+        taken = np.bincount(offsets[taken[valid]], minlength=len(total))
+        present = np.flatnonzero(total)
+        chunk_days = (present + first).astype('datetime64[D]')
+        
+        # Merge into the sorted running index
+        days = np.union1d(self.days, chunk_days)
+        merged_total = np.zeros(len(days), dtype=np.int64)
+        merged_taken = np.zeros(len(days), dtype=np.int64)
+        old = np.searchsorted(days, self.days)
+        new = np.searchsorted(days, chunk_days)
+        merged_total[old] += self.total
+        merged_taken[old] += self.taken
+        merged_total[new] += total[present]
+        merged_taken[new] += taken[present]
+        self.days, self.total, self.taken = days, merged_total, merged_taken
+    
+    def frame(self):
+        """Daily counts as a DataFrame indexed by date"""
+        return pd.DataFrame(
+            {'total': self.total, 'taken': self.taken},
+            index=pd.DatetimeIndex(self.days.astype('datetime64[ns]'), name='date')
+        )
+    
+    def resample(self, freq='W'):
+        """
+        Counts and rate per period, in chronological order. freq is 'D',
+        'W' (ISO weeks, with iso_year/week columns) or 'M'. Periods with no
+        doses between the first and last are kept with total 0 and rate NaN.
+        """
+        counts = self.frame().resample(**RESAMPLE_RULES[freq]).sum()
+        return self._with_rate(counts, freq)
+    
+    def rolling(self, weeks=4):
+        """Weekly counts and rate summed over a trailing window of N weeks"""
+        counts = self.frame().resample(**RESAMPLE_RULES['W']).sum()
+        counts = counts.rolling(weeks, min_periods=1).sum().astype(np.int64)
+        return self._with_rate(counts, 'W')
+    
+    @staticmethod
+    def _with_rate(counts, freq):
+        counts['rate'] = (counts['taken'] / counts['total'].where(counts['total'] > 0) * 100).round(2)
+        if freq == 'W':
+            iso = counts.index.isocalendar()
+            counts['iso_year'] = iso['year'].to_numpy(np.int64)
+            counts['week'] = iso['week'].to_numpy(np.int64)
+        return counts
+
+class LogAggregates:
+    """
+    Running dose counts that everything in the reports and charts is
+    derived from: overall, per hour of day, per weekday, per user, per
+    medication, per day (see DailyCounts), per user or medication and
+    day for streaks (see streaks.DoseDays), and taken doses per delay for
+    dose timing (see dose_timing.DelayCounts). Memory grows with the
+    number of groups, days and distinct delays, not the number of log rows.
+    """
+    
+    def __init__(self):
+        self.total = 0
+        self.taken = 0
+        self.missed = 0
+        self.hour_total = np.zeros(24, dtype=np.int64)
+        self.hour_taken = np.zeros(24, dtype=np.int64)
+        self.day_total = np.zeros(7, dtype=np.int64)
+        self.day_taken = np.zeros(7, dtype=np.int64)
+        self.users = GroupCounter()
+        self.medications = GroupCounter()
+        self.daily = DailyCounts()
+        self.user_days = DoseDays()
+        self.medication_days = DoseDays()
+        self.delays = {key: DelayCounts() for key in DELAY_GROUPINGS}
+        # Set once a chunk with taken_time was folded
+        self.has_timing = False
+    
+    @classmethod
+    def from_frame(cls, df):
+        return cls().fold(df)
+    
+    @classmethod
+    def from_csv(cls, path, chunksize=500_000):
+        """Stream a log CSV, keeping only the aggregates in memory"""
+        aggregates = cls()
+        for chunk in read_log_chunks(path, chunksize, AGGREGATE_COLUMNS):
+            aggregates.fold(chunk)
+        return aggregates
+    
+    def to_arrays(self):
+        """Every running count as a flat {name: ndarray} dict, e.g. for np.savez"""
+        arrays = {
+            'totals': np.array([self.total, self.taken, self.missed], dtype=np.int64),
+            'hour_total': self.hour_total,
+            'hour_taken': self.hour_taken,
+            'day_total': self.day_total,
+            'day_taken': self.day_taken,
+            'daily_days': self.daily.days,
+            'daily_total': self.daily.total,
+            'daily_taken': self.daily.taken
+        }
+        for name in ['users', 'medications']:
+            counter = getattr(self, name)
+            arrays[f'{name}_labels'] = np.array([str(label) for label in counter.labels], dtype=str)
+            arrays[f'{name}_total'] = counter.total
+            arrays[f'{name}_taken'] = counter.taken
+        for name in ['user_days', 'medication_days']:
+            dose_days = getattr(self, name)
+            arrays[f'{name}_keys'] = dose_days.keys
+            arrays[f'{name}_total'] = dose_days.total
+            arrays[f'{name}_taken'] = dose_days.taken
+        for key, delays in self.delays.items():
+            arrays[f'delays_{key}_keys'] = delays.keys
+            arrays[f'delays_{key}_counts'] = delays.counts
+        arrays['has_timing'] = np.array(self.has_timing)
+        return arrays
+    
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild aggregates from to_arrays() output; folding can continue from there"""
+        aggregates = cls()
+        aggregates.total, aggregates.taken, aggregates.missed = (int(v) for v in arrays['totals'])
+        for name in ['hour_total', 'hour_taken', 'day_total', 'day_taken']:
+            setattr(aggregates, name, np.array(arrays[name], dtype=np.int64))
+        aggregates.daily.days = np.array(arrays['daily_days'], dtype='datetime64[D]')
+        aggregates.daily.total = np.array(arrays['daily_total'], dtype=np.int64)
+        aggregates.daily.taken = np.array(arrays['daily_taken'], dtype=np.int64)
+        for name in ['users', 'medications']:
+            counter = getattr(aggregates, name)
+            counter.labels = arrays[f'{name}_labels'].tolist()
+            counter._index = {label: i for i, label in enumerate(counter.labels)}
+            counter.total = np.array(arrays[f'{name}_total'], dtype=np.int64)
+            counter.taken = np.array(arrays[f'{name}_taken'], dtype=np.int64)
+        for name in ['user_days', 'medication_days']:
+            dose_days = getattr(aggregates, name)
+            dose_days.keys = np.array(arrays[f'{name}_keys'], dtype=np.int64)
+            dose_days.total = np.array(arrays[f'{name}_total'], dtype=np.int64)
+            dose_days.taken = np.array(arrays[f'{name}_taken'], dtype=np.int64)
+        for key, delays in aggregates.delays.items():
+            delays.keys = np.array(arrays[f'delays_{key}_keys'], dtype=np.int64)
+            delays.counts = np.array(arrays[f'delays_{key}_counts'], dtype=np.int64)
+        aggregates.has_timing = bool(arrays['has_timing'])
+        return aggregates
+    
+    def fold(self, chunk):
+        """Add one chunk of log rows to the running counts"""
+        status = chunk['status']
+        taken = (status == 'taken').to_numpy()
+        self.total += len(chunk)
+        self.taken += int(taken.sum())
+        self.missed += int((status == 'missed').sum())
+        
+        hours = chunk['hour_of_day'].to_numpy()
+        valid = (hours >= 0) & (hours <= 23)
+        self.hour_total += np.bincount(hours[valid].astype(np.int64), minlength=24)
+        self.hour_taken += np.bincount(hours[valid & taken].astype(np.int64), minlength=24)
+        
+        days = chunk['day_of_week'].to_numpy()
+        valid = (days >= 0) & (days <= 6)
+        self.day_total += np.bincount(days[valid].astype(np.int64), minlength=7)
+        self.day_taken += np.bincount(days[valid & taken].astype(np.int64), minlength=7)
+        
+        # Grouped sections are skipped when their column was not read
+        users = medications = None
+        if 'user_id' in chunk.columns:
+            users = self.users.add(chunk['user_id'], taken)
+        if 'medication_id' in chunk.columns:
+            medications = self.medications.add(chunk['medication_id'], taken)
+        
+        if 'scheduled_time' in chunk.columns:
+            scheduled = chunk['scheduled_time']
+            if not pd.api.types.is_datetime64_any_dtype(scheduled):
+                scheduled = pd.to_datetime(scheduled)
+            days = scheduled.to_numpy().astype('datetime64[D]')
+            self.daily.add(days, taken)
+            if users is not None:
+                self.user_days.add(users, days, taken)
+            if medications is not None:
+                self.medication_days.add(medications, days, taken)
+            if 'taken_time' in chunk.columns:
+                self._fold_delays(chunk, scheduled, taken, users, medications)
+        return self
+    
+    def _fold_delays(self, chunk, scheduled, taken, users, medications):
+        """Add the delays of one chunk's taken doses to each grouping's DelayCounts"""
+        taken_time = chunk['taken_time']
+        if not pd.api.types.is_datetime64_any_dtype(taken_time):
+            taken_time = pd.to_datetime(taken_time)
+        seconds, timed = delay_seconds(scheduled.to_numpy(), taken_time.to_numpy(), taken)
+        
+        hours = chunk['hour_of_day'].to_numpy().astype(np.int64)
+        days = chunk['day_of_week'].to_numpy().astype(np.int64)
+        codes = {
+            'overall': np.zeros(len(chunk), dtype=np.int64),
+            'by_user': users,
+            'by_medication': medications,
+            'by_hour': np.where((hours >= 0) & (hours <= 23), hours, -1),
+            'by_day_of_week': np.where((days >= 0) & (days <= 6), days, -1)
+        }
+        for key, group_codes in codes.items():
+            if group_codes is not None:
+                self.delays[key].add(group_codes[timed], seconds)
+        self.has_timing = True
+    
+    def dose_timing(self, late_after=LATE_AFTER_MINUTES):
+        """dose_timing.timing_report() of the folded delays, or None if taken_time was not read"""
+        if not self.has_timing:
+            return None
+        labels = {
+            'by_user': self.users.labels,
+            'by_medication': self.medications.labels,
+            'by_hour': list(range(24)),
+            'by_day_of_week': list(range(7))
+        }
+        return timing_report(self.delays, labels, late_after)
+    
+    def time_of_day_counts(self):
+        """Total and taken doses per report time bucket (Morning, Afternoon, Evening)"""
+        buckets = HOUR_TO_BUCKET >= 0
+        total = np.bincount(HOUR_TO_BUCKET[buckets], weights=self.hour_total[buckets], minlength=3)
+        taken = np.bincount(HOUR_TO_BUCKET[buckets], weights=self.hour_taken[buckets], minlength=3)
+        return total.astype(np.int64), taken.astype(np.int64)
@@ -0,0 +1,191 @@
+"""
+Materialized adherence aggregates with incremental refresh.
+
+The LogAggregates of the whole log (overall, per hour, weekday, user,
+medication and day, per user x day and medication x day for streaks,
+and the dose delay counts for dose timing) are saved to outputs/materialized/aggregates.npz. refresh() folds in only
+the rows appended to the source since the last run, so the dashboard and
+the analysis report are derived from the saved counts instead of a scan
+of the full log.
+
+Sources:
+- a log CSV: the byte offset after the last complete line is saved and
+  only the lines after it are read. If the file shrank or its beginning
+  changed, it was rewritten and the aggregates are rebuilt.
+- a LogStore directory: the Parquet files already folded are saved and
+  only new files are read. compact() rewrites every file, so the next
+  refresh after it rebuilds.
+
+Usage:
+    python materialized.py [refresh|rebuild] [adherence_logs.csv | log_store/]
+
+Run rebuild after changing how the aggregates are defined, and bump
+MATERIALIZED_VERSION so saved state from older code is rebuilt anyway.
+"""
+import io
+import json
+import os
+import sys
+import time
+import zipfile
+import zlib
+import numpy as np
+from log_stream import AGGREGATE_COLUMNS, LogAggregates, read_log_chunks
+
+MATERIALIZED_VERSION = 2
+DEFAULT_DIR = 'outputs/materialized'
+
+# Bytes at the start of a CSV whose checksum detects a rewritten file
+PREFIX_BYTES = 1 << 16
+
+class _ByteRange(io.RawIOBase):
+    """Read-only view of bytes [start, end) of an open binary file"""
+    
+    def __init__(self, f, start, end):
+        f.seek(start)
+        self._f = f
+        self._remaining = end - start
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        n = min(len(buffer), self._remaining)
+        if n <= 0:
+            return 0
+        data = self._f.read(n)
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+def _complete_end(f, start, size, block=PREFIX_BYTES):
+    """Offset just after the last newline in [start, size); a writer may be mid-line"""
+    pos = size
+    while pos > start:
+        read_from = max(start, pos - block)
+        f.seek(read_from)
+        newline = f.read(pos - read_from).rfind(b'\n')
+        if newline >= 0:
+            return read_from + newline + 1
+        pos = read_from
+    return start
+
+def _prefix_checksum(f, length):
+    f.seek(0)
+    return zlib.crc32(f.read(min(length, PREFIX_BYTES)))
+
+class MaterializedAggregates:
+    def __init__(self, source='adherence_logs.csv', state_dir=DEFAULT_DIR, chunksize=500_000):
+        self.source = source
+        self.state_dir = state_dir
+        self.chunksize = chunksize
+        self.path = os.path.join(state_dir, 'aggregates.npz')
+        self.last_refresh = {}
+    
+    def _is_store(self):
+        return os.path.isdir(self.source)
+    
+    def load(self):
+        """(state, aggregates) saved for this source, or (None, None)"""
+        try:
+            with np.load(self.path) as arrays:
+                state = json.loads(str(arrays['state']))
+                aggregates = LogAggregates.from_arrays(arrays)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return None, None
+        if state.get('version') != MATERIALIZED_VERSION or state.get('source') != self.source:
+            return None, None
+        return state, aggregates
+    
+    def save(self, state, aggregates):
+        """
+        Write the counts and the source position they cover to one file,
+        replaced atomically so the two never disagree
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(tmp_path, state=np.array(json.dumps(state)), **aggregates.to_arrays())
+        os.replace(tmp_path, self.path)
+    
+    def rebuild(self):
+        """Recompute the aggregates from the whole source and save them"""
+        return self._update(None, LogAggregates())
+    
+    def refresh(self):
+        """
+        Fold rows added since the last refresh into the saved aggregates
+        (rebuilding if there are none or the source was rewritten) and
+        return the up-to-date LogAggregates.
+        """
+        state, aggregates = self.load()
+        if state is None:
+            return self.rebuild()
+        return self._update(state, aggregates)
+    
+    def _update(self, state, aggregates):
+        start = time.perf_counter()
+        if self._is_store():
+            new_state, rows = self._fold_store(state, aggregates)
+        else:
+            new_state, rows = self._fold_csv(state, aggregates)
+        if new_state is None:
+            # Source was rewritten: start again from an empty state
+            return self.rebuild()
+        
+        new_state.update(version=MATERIALIZED_VERSION, source=self.source)
+        self.save(new_state, aggregates)
+        self.last_refresh = {
+            'mode': 'rebuild' if state is None else 'refresh',
+            'new_rows': rows,
+            'total_rows': aggregates.total,
+            'ms': round((time.perf_counter() - start) * 1000, 2)
+        }
+        return aggregates
+    
+    def _fold_csv(self, state, aggregates):
+        """Fold complete lines after the saved offset; (new state, rows) or (None, 0) if rewritten"""
+        size = os.path.getsize(self.source)
+        with open(self.source, 'rb') as f:
+            header = f.readline()
+            offset = state['offset'] if state else f.tell()
+            if state and (size < offset or _prefix_checksum(f, offset) != state['prefix_crc']):
+                return None, 0
+            
+            end = _complete_end(f, offset, size)
+            rows = 0
+            if end > offset:
+                names = header.decode('utf-8').strip().split(',')
+                reader = io.BufferedReader(_ByteRange(f, offset, end))
+                for chunk in read_log_chunks(reader, self.chunksize, AGGREGATE_COLUMNS, names):
+                    aggregates.fold(chunk)
+                    rows += len(chunk)
+            return {'offset': end, 'prefix_crc': _prefix_checksum(f, end)}, rows
+    
+    def _fold_store(self, state, aggregates):
+        """Fold Parquet files not folded before; (new state, rows) or (None, 0) if rewritten"""
+        from log_store import LogStore
+        store = LogStore(self.source)
+        files = store.files()
+        done = set(state['files']) if state else set()
+        if not done <= set(files):
+            return None, 0
+        
+        new_files = [path for path in files if path not in done]
+        rows = 0
+        if new_files:
+            for batch in store.iter_batches(AGGREGATE_COLUMNS, files=new_files):
+                aggregates.fold(batch)
+                rows += len(batch)
+        return {'files': sorted(files)}, rows
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else 'refresh'
+    if command not in ('refresh', 'rebuild'):
+        print("Usage: python materialized.py [refresh|rebuild] [adherence_logs.csv | log_store/]")
+        sys.exit(1)
+    
+    materialized = MaterializedAggregates(sys.argv[2] if len(sys.argv) > 2 else 'adherence_logs.csv')
+    aggregates = materialized.rebuild() if command == 'rebuild' else materialized.refresh()
+    info = materialized.last_refresh
+    print(f"✓ {info['mode'].capitalize()}: {info['new_rows']} new rows, "
+          f"{info['total_rows']} total, {info['ms']} ms")
@@ -0,0 +1,107 @@
+"""
+Streaks of fully adherent days.
+
+A day counts towards a streak when every dose scheduled that day was
+taken, so days with several doses need all of them. Days with nothing
+scheduled neither extend nor break a streak. Per-group (user or
+medication) dose counts are kept per calendar day in DoseDays, sorted by
+(group, day), and streaks are found with run-length encoding over the
+daily completion flags: one pass for all groups, no per-group loop.
+"""
+import numpy as np
+import pandas as pd
+
+# Sort key: group code in the high 32 bits, day number (offset so dates
+# before 1970 stay non-negative) in the low 32 bits
+DAY_BITS = 32
+DAY_OFFSET = 2 ** 31
+
+def _encode(codes, days):
+    return (codes.astype(np.int64) << DAY_BITS) | (days.astype(np.int64) + DAY_OFFSET)
+
+def _decode(keys):
+    return keys >> DAY_BITS, (keys & (2 ** DAY_BITS - 1)) - DAY_OFFSET
+
+class DoseDays:
+    """Running total/taken dose counts per (group code, calendar day), kept sorted"""
+    
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0, dtype=np.int64)
+        self.taken = np.zeros(0, dtype=np.int64)
+    
+    def add(self, codes, days, taken):
+        """
+        Fold one chunk: codes are integer group codes (negative skipped),
+        days a datetime64[D] array (NaT skipped), taken a boolean mask.
+        """
+        valid = (codes >= 0) & ~np.isnat(days)
+        if not valid.any():
+            return
+        keys = _encode(codes[valid], days[valid].astype(np.int64))
+        chunk_keys, inverse = np.unique(keys, return_inverse=True)
+        total = np.bincount(inverse, minlength=len(chunk_keys))
+        taken = np.bincount(inverse[taken[valid]], minlength=len(chunk_keys))
+        
+        # Both key arrays are sorted, so the stable sort is a linear merge
+        keys = np.concatenate([self.keys, chunk_keys])
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        self.keys = keys[starts]
+        self.total = np.add.reduceat(np.concatenate([self.total, total])[order], starts)
+        self.taken = np.add.reduceat(np.concatenate([self.taken, taken])[order], starts)
+    
+    def streaks(self, as_of=None):
+        """compute_streaks() over the folded counts"""
+        codes, days = _decode(self.keys)
+        return compute_streaks(codes, days, self.total, self.taken, as_of)
+
+def compute_streaks(codes, days, total, taken, as_of=None):
+    """
+    Streak statistics per group from daily dose counts sorted by (code, day).
+    
+    Returns a DataFrame indexed by group code with current_streak (run of
+    complete days ending at the group's last scheduled day), longest_streak,
+    days_tracked, last_day, last_missed_day and days_since_last_miss
+    (counted to as_of, default the latest day of any group; NaN if the
+    group never missed a day).
+    """
+    columns = ['current_streak', 'longest_streak', 'days_tracked', 'last_day',
+               'last_missed_day', 'days_since_last_miss']
+    n = len(codes)
+    if n == 0:
+        return pd.DataFrame(columns=columns)
+    
+    complete = taken == total
+    new_group = np.concatenate([[True], codes[1:] != codes[:-1]])
+    group_starts = np.flatnonzero(new_group)
+    group_ends = np.append(group_starts[1:], n) - 1
+    
+    # Runs of equal completion flags within each group
+    boundary = new_group.copy()
+    boundary[1:] |= complete[1:] != complete[:-1]
+    run_starts = np.flatnonzero(boundary)
+    run_lengths = np.diff(np.append(run_starts, n))
+    complete_lengths = np.where(complete[run_starts], run_lengths, 0)
+    
+    # Group g's runs are run_starts[group_first_run[g]:group_first_run[g + 1]]
+    group_first_run = np.flatnonzero(new_group[run_starts])
+    longest = np.maximum.reduceat(complete_lengths, group_first_run)
+    last_run = np.append(group_first_run[1:], len(run_starts)) - 1
+    current = complete_lengths[last_run]
+    
+    missed_days = np.where(complete, np.iinfo(np.int64).min, days)
+    last_missed = np.maximum.reduceat(missed_days, group_starts)
+    never_missed = last_missed == np.iinfo(np.int64).min
+    as_of = days.max() if as_of is None else np.datetime64(as_of, 'D').astype(np.int64)
+    
+    return pd.DataFrame({
+        'current_streak': current,
+        'longest_streak': longest,
+        'days_tracked': group_ends - group_starts + 1,
+        'last_day': days[group_ends].astype('datetime64[D]'),
+        'last_missed_day': np.where(never_missed, np.datetime64('NaT'),
+                                    last_missed.astype('datetime64[D]')),
+        'days_since_last_miss': np.where(never_missed, np.nan, as_of - last_missed)
+    }, index=pd.Index(codes[group_starts], name='code'), columns=columns)
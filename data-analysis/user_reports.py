@@ -0,0 +1,193 @@
+"""
+Per-user adherence reports for every user in the log.
+
+The log is loaded once, sorted by user and copied into shared memory as
+plain NumPy columns. Worker processes attach to those blocks and receive
+only (user, start row, end row) ranges, so no DataFrame is pickled per
+task. Each user gets the same report as AdherenceAnalyzer.generate_full_report(),
+written to <out_dir>/<user_id>.json.
+
+Usage:
+    python user_reports.py [adherence_logs.csv | log_store/] [--out outputs/user_reports]
+                           [--workers 1,2,4]
+
+With several worker counts, the reports are generated once per count and
+the throughput of each run is printed.
+"""
+import argparse
+import json
+import os
+import re
+import time
+from multiprocessing import Pool, shared_memory
+import numpy as np
+import pandas as pd
+from analyze_adherence import AdherenceAnalyzer
+from log_stream import LogAggregates, read_logs
+
+REPORT_COLUMNS = ['user_id', 'medication_id', 'scheduled_time', 'taken_time', 'status',
+                  'day_of_week', 'hour_of_day']
+DEFAULT_OUT_DIR = 'outputs/user_reports'
+
+# Tasks per worker, so uneven users still balance across the pool
+TASKS_PER_WORKER = 8
+
+class SharedColumns:
+    """NumPy arrays copied into named shared memory blocks"""
+    
+    def __init__(self, arrays):
+        self._blocks = []
+        self.spec = {}
+        for name, array in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[:] = array
+            self._blocks.append(block)
+            self.spec[name] = (block.name, array.shape, array.dtype.str)
+    
+    @staticmethod
+    def attach(spec):
+        """(blocks, arrays) for a spec from another process; keep blocks referenced"""
+        blocks, arrays = [], {}
+        for name, (block_name, shape, dtype) in spec.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            blocks.append(block)
+            arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+        return blocks, arrays
+    
+    def close(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+def load_logs(source):
+    """Report columns from a log CSV or a LogStore directory"""
+    if os.path.isdir(source):
+        from log_store import LogStore
+        return LogStore(source).query(columns=REPORT_COLUMNS)
+    return read_logs(source, REPORT_COLUMNS)
+
+def shard_by_user(df):
+    """
+    Sort the log by user into shareable columns.
+    
+    Returns (arrays, labels, offsets): arrays holds integer codes and raw
+    values per column, labels the category names for each code column,
+    and rows offsets[i]:offsets[i + 1] belong to user i. The sort is
+    stable, so each user's rows keep their log order.
+    """
+    users, user_labels = pd.factorize(df['user_id'].astype(str), sort=True)
+    meds, med_labels = pd.factorize(df['medication_id'].astype(str))
+    status, status_labels = pd.factorize(df['status'].astype(str))
+    order = np.argsort(users, kind='stable')
+    
+    arrays = {
+        'medication_id': meds[order].astype(np.int32),
+        'status': status[order].astype(np.int8),
+        'scheduled_time': df['scheduled_time'].to_numpy('datetime64[ns]')[order],
+        'taken_time': df['taken_time'].to_numpy('datetime64[ns]')[order],
+        'day_of_week': df['day_of_week'].to_numpy(np.int8)[order],
+        'hour_of_day': df['hour_of_day'].to_numpy(np.int8)[order]
+    }
+    labels = {
+        'user_id': list(user_labels),
+        'medication_id': list(med_labels),
+        'status': list(status_labels)
+    }
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(users, minlength=len(user_labels)))])
+    return arrays, labels, offsets
+
+def make_tasks(offsets, n_tasks):
+    """Split users into up to n_tasks contiguous groups of roughly equal rows"""
+    n_users = len(offsets) - 1
+    bounds = np.searchsorted(offsets, np.linspace(0, offsets[-1], n_tasks + 1))
+    bounds = np.unique(np.clip(bounds, 0, n_users))
+    bounds[0], bounds[-1] = 0, n_users
+    return [
+        [(user, int(offsets[user]), int(offsets[user + 1])) for user in range(start, end)]
+        for start, end in zip(bounds[:-1], bounds[1:]) if end > start
+    ]
+
+# Worker state, set once per process by _init_worker
+_worker = {}
+
+def _init_worker(spec, labels, out_dir):
+    blocks, arrays = SharedColumns.attach(spec)
+    # Build the category dtypes once; validating them per user dominates small shards
+    dtypes = {name: pd.CategoricalDtype(values) for name, values in labels.items()}
+    _worker.update(blocks=blocks, arrays=arrays, labels=labels, dtypes=dtypes,
+                   out_dir=out_dir)
+
+def _user_frame(user, start, end):
+    """One user's rows as a DataFrame of views over the shared columns"""
+    arrays, dtypes = _worker['arrays'], _worker['dtypes']
+    n = end - start
+    return pd.DataFrame({
+        'user_id': pd.Categorical.from_codes(np.full(n, user), dtype=dtypes['user_id']),
+        'medication_id': pd.Categorical.from_codes(arrays['medication_id'][start:end],
+                                                   dtype=dtypes['medication_id']),
+        'scheduled_time': arrays['scheduled_time'][start:end],
+        'taken_time': arrays['taken_time'][start:end],
+        'status': pd.Categorical.from_codes(arrays['status'][start:end], dtype=dtypes['status']),
+        'day_of_week': arrays['day_of_week'][start:end],
+        'hour_of_day': arrays['hour_of_day'][start:end]
+    })
+
+def _report_users(task):
+    """Write the report for each (user, start, end) in task; returns rows covered"""
+    rows = 0
+    for user, start, end in task:
+        user_id = _worker['labels']['user_id'][user]
+        aggregates = LogAggregates.from_frame(_user_frame(user, start, end))
+        report = {'user_id': user_id}
+        report.update(AdherenceAnalyzer.from_aggregates(aggregates).generate_full_report())
+        
+        filename = re.sub(r'[^\w.-]', '_', user_id) + '.json'
+        with open(os.path.join(_worker['out_dir'], filename), 'w') as f:
+            json.dump(report, f, indent=2)
+        rows += end - start
+    return rows
+
+def generate_user_reports(shared, labels, offsets, out_dir=DEFAULT_OUT_DIR, workers=None):
+    """Write every user's report with a pool of workers; returns elapsed seconds"""
+    workers = workers or os.cpu_count()
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = make_tasks(offsets, workers * TASKS_PER_WORKER)
+    
+    start = time.perf_counter()
+    with Pool(workers, initializer=_init_worker,
+              initargs=(shared.spec, labels, out_dir)) as pool:
+        for _ in pool.imap_unordered(_report_users, tasks):
+            pass
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Write one adherence report per user")
+    parser.add_argument('source', nargs='?', default='adherence_logs.csv',
+                        help="log CSV or LogStore directory")
+    parser.add_argument('--out', default=DEFAULT_OUT_DIR)
+    parser.add_argument('--workers', default=str(os.cpu_count()),
+                        help="worker count, or a comma-separated list to compare")
+    args = parser.parse_args()
+    
+    start = time.perf_counter()
+    df = load_logs(args.source)
+    arrays, labels, offsets = shard_by_user(df)
+    del df
+    n_users, n_rows = len(labels['user_id']), int(offsets[-1])
+    print(f"✓ Loaded {n_rows} records for {n_users} users "
+          f"in {time.perf_counter() - start:.2f}s")
+    
+    shared = SharedColumns(arrays)
+    del arrays
+    try:
+        for workers in [int(w) for w in args.workers.split(',')]:
+            elapsed = generate_user_reports(shared, labels, offsets, args.out, workers)
+            print(f"  workers={workers}: {elapsed:.2f}s, "
+                  f"{n_users / elapsed:.1f} users/s, {n_rows / elapsed:,.0f} rows/s")
+    finally:
+        shared.close()
+    print(f"✓ {n_users} user reports written to {args.out}/")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import base64
+import zlib
+import numpy as np
+import pandas as pd
+from model import metrics
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+PERIODS = ['Morning', 'Afternoon', 'Evening', 'Night']
+
+# Period index for each hour: Morning 5-11, Afternoon 12-16, Evening 17-21, Night 22-4
+HOUR_TO_PERIOD = np.array([3] * 5 + [0] * 7 + [1] * 5 + [2] * 5 + [3] * 2, dtype=np.int8)
+
+# Extra slot for logs without a usable date
+UNKNOWN_DAY = len(DAY_NAMES)
+UNKNOWN_PERIOD = len(PERIODS)
+
+# Shape of the aggregate: day_of_week (+unknown) x period (+unknown) x [not taken, taken]
+COUNTS_SHAPE = (len(DAY_NAMES) + 1, len(PERIODS) + 1, 2)
+
+# Prefix of serialized aggregate state; bump if COUNTS_SHAPE changes
+STATE_VERSION = b'AS1'
+
+def empty_counts():
+    return np.zeros(COUNTS_SHAPE, dtype=np.int64)
+
+def encode_state(counts):
+    """Serialize a counts array to an opaque, URL-safe token"""
+    payload = STATE_VERSION + counts.astype('<u4').tobytes()
+    return base64.urlsafe_b64encode(zlib.compress(payload)).decode('ascii')
+
+def decode_state(token):
+    """Parse a token from encode_state(); raises ValueError if it is not valid"""
+    try:
+        payload = zlib.decompress(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (AttributeError, ValueError, zlib.error):
+        raise ValueError("Invalid analytics state")
+    
+    body = payload[len(STATE_VERSION):]
+    if not payload.startswith(STATE_VERSION) or len(body) != 4 * int(np.prod(COUNTS_SHAPE)):
+        raise ValueError("Invalid or outdated analytics state")
+    return np.frombuffer(body, dtype='<u4').astype(np.int64).reshape(COUNTS_SHAPE)
+
+def _field(logs, name):
+    """One field across all logs as a Series, or None if no log has it"""
+    if not any(name in log for log in logs):
+        return None
+    return pd.Series([log.get(name) for log in logs])
+
+def _parse_one(value, utc):
+    """One timestamp as UTC, or as the wall-clock time in its own offset; NaT if invalid"""
+    parsed = pd.to_datetime(value, errors='coerce', utc=utc)
+    if parsed is pd.NaT or utc or parsed.tzinfo is None:
+        return parsed
+    return parsed.tz_localize(None)
+
+def _parse_column(values, utc):
+    """
+    Parse a Series of timestamps in one vectorized call. Values pandas
+    can't parse together (several UTC offsets, or naive next to aware
+    times) come back as NaT or raise there, so those are parsed one by one.
+    """
+    try:
+        parsed = pd.to_datetime(values, errors='coerce', utc=utc)
+    except ValueError:
+        parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[us]')
+    if not utc and parsed.dt.tz is not None:
+        parsed = parsed.dt.tz_localize(None)
+    
+    retry = (parsed.isna() & values.notna()).to_numpy()
+    if retry.any():
+        parsed[retry] = [_parse_one(value, utc) for value in values[retry]]
+    return parsed
+
+def _parse_times(values):
+    """
+    Wall-clock timestamps for count_logs and the timing groups alike:
+    hour and weekday are read in the offset written in each string, not
+    in UTC
+    """
+    return _parse_column(values, utc=False)
+
+def _parse_instants(values):
+    """UTC timestamps to subtract from each other; naive times are taken as UTC"""
+    return _parse_column(values, utc=True)
+
+def count_logs(logs):
+    """
+    Reduce raw logs to a COUNTS_SHAPE array of dose counts in one pass.
+    
+    Expected Input: [ { "status": "taken", "scheduledTime": "...", "date": "..." }, ... ]
+    Day and period come from 'date' if present, else 'scheduledTime'.
+    Only these fields are read, so no full DataFrame of the payload is built.
+    """
+    with metrics.timed('build_frame'):
+        status = _field(logs, 'status')
+        
+        # Ensure 'status' field exists
+        if status is None:
+            raise ValueError("Data missing 'status' field")
+        
+        dates = _field(logs, 'date')
+        if dates is None:
+            dates = _field(logs, 'scheduledTime')
+        if dates is not None:
+            dates = _parse_times(dates)
+    
+    with metrics.timed('count'):
+        return _count_fields(status, dates, len(logs))
+
+def _count_fields(status, dates, n):
+    """Bin n logs' status and parsed dates into a COUNTS_SHAPE array"""
+    taken = status.eq('taken').to_numpy(dtype=np.int64)
+    
+    if dates is not None:
+        valid = dates.notna().to_numpy()
+        day = np.where(valid, dates.dt.dayofweek.fillna(0).to_numpy(dtype=np.int64), UNKNOWN_DAY)
+        hour = dates.dt.hour.fillna(0).to_numpy(dtype=np.int64)
+        period = np.where(valid, HOUR_TO_PERIOD[hour], UNKNOWN_PERIOD)
+    else:
+        day = np.full(n, UNKNOWN_DAY)
+        period = np.full(n, UNKNOWN_PERIOD)
+    
+    # Single grouping pass over the combined (day, period, taken) key
+    key = np.ravel_multi_index((day, period, taken), COUNTS_SHAPE)
+    counts = np.bincount(key, minlength=int(np.prod(COUNTS_SHAPE)))
+    return counts.reshape(COUNTS_SHAPE)
+
+def _rate(taken, total):
+    return round(taken / total * 100, 2) if total > 0 else 0
+
+def summarize_counts(counts):
+    """Build the /analyze response from a COUNTS_SHAPE array"""
+    total_doses = int(counts.sum())
+    taken_doses = int(counts[:, :, 1].sum())
+    
+    by_day = counts[:UNKNOWN_DAY].sum(axis=1)            # (7, 2)
+    by_period = counts[:, :UNKNOWN_PERIOD].sum(axis=0)   # (4, 2)
+    
+    weekly_trend = {}
+    day_of_week_rates = {}
+    for i, name in enumerate(DAY_NAMES):
+        taken, total = int(by_day[i, 1]), int(by_day[i].sum())
+        if taken:
+            weekly_trend[name] = taken
+        if total:
+            day_of_week_rates[name] = _rate(taken, total)
+    
+    time_of_day_stats = {}
+    time_of_day_rates = {}
+    for i, name in enumerate(PERIODS):
+        taken, total = int(by_period[i, 1]), int(by_period[i].sum())
+        if taken:
+            time_of_day_stats[name] = taken
+        if total:
+            time_of_day_rates[name] = _rate(taken, total)
+    
+    return {
+        "adherence_rate": _rate(taken_doses, total_doses),
+        "total_doses": total_doses,
+        "weekly_trend": weekly_trend,            # e.g., {"Monday": 5, "Tuesday": 3}
+        "time_of_day_stats": time_of_day_stats,  # e.g., {"Morning": 10, "Evening": 2}
+        "day_of_week_rates": day_of_week_rates,  # e.g., {"Monday": 83.33}
+        "time_of_day_rates": time_of_day_rates   # e.g., {"Morning": 90.0}
+    }
+
+# Dose timing: same statistics, schema and bins as data-analysis/dose_timing.py
+# (group_timing / _entry), so /analyze and the offline report agree. The
+# services deploy separately, so keep the two in step by hand.
+
+# Doses taken more than this many minutes after scheduledTime are late
+LATE_AFTER_MINUTES = 30
+
+DELAY_QUANTILES = (0.5, 0.9, 0.95)
+
+# Delay histogram bin edges (minutes); the first and last bins are open-ended
+DELAY_BIN_EDGES = np.array([-60, -30, -15, 0, 15, 30, 60, 120, 240])
+
+def _delay_bins():
+    edges = DELAY_BIN_EDGES.tolist()
+    return ([f'<{edges[0]}'] + [f'{lo} to {hi}' for lo, hi in zip(edges[:-1], edges[1:])]
+            + [f'>={edges[-1]}'])
+
+def _group_delays(codes, delays, n_groups, late_after):
+    """
+    Delay stats per group code: one sort by (group, delay) gives every
+    group's percentiles, one bincount over (group, bin) its histogram
+    """
+    doses = np.bincount(codes, minlength=n_groups)
+    late = np.bincount(codes[delays > late_after], minlength=n_groups)
+    total_delay = np.bincount(codes, weights=delays, minlength=n_groups)
+    
+    # Linear interpolation between order statistics, as np.percentile does
+    ordered = delays[np.lexsort((delays, codes))]
+    starts = np.cumsum(doses) - doses
+    last = np.maximum(doses - 1, 0)
+    positions = starts[:, None] + np.asarray(DELAY_QUANTILES)[None, :] * last[:, None]
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, (starts + doses - 1)[:, None])
+    fraction = positions - lower
+    quantiles = np.full(positions.shape, np.nan)
+    has_doses = doses > 0
+    if len(ordered):
+        quantiles[has_doses] = (ordered[lower[has_doses]] * (1 - fraction[has_doses])
+                                + ordered[upper[has_doses]] * fraction[has_doses])
+    
+    n_bins = len(DELAY_BIN_EDGES) + 1
+    bins = np.searchsorted(DELAY_BIN_EDGES, delays, side='right')
+    histogram = np.bincount(codes * n_bins + bins, minlength=n_groups * n_bins)
+    histogram = histogram.reshape(n_groups, n_bins)
+    
+    mean = np.full(n_groups, np.nan)
+    np.divide(total_delay, doses, out=mean, where=has_doses)
+    return [_delay_entry(doses[i], late[i], mean[i], quantiles[i], histogram[i])
+            for i in range(n_groups)]
+
+def _round_delay(value):
+    return None if np.isnan(value) else round(float(value), 1)
+
+def _delay_entry(doses, late, mean, quantiles, histogram):
+    doses, late = int(doses), int(late)
+    return {
+        "doses": doses,
+        "late": late,
+        "late_rate": _rate(late, doses),
+        "mean_delay": _round_delay(mean),
+        **{f"p{round(q * 100)}": _round_delay(value)
+           for q, value in zip(DELAY_QUANTILES, quantiles)},
+        "histogram": histogram.tolist()
+    }
+
+def timing_stats(logs, late_after=LATE_AFTER_MINUTES):
+    """
+    Delay (takenTime - scheduledTime, minutes) distribution of the taken
+    doses in logs: overall and per medication, hour and day of week.
+    Only logs with status 'taken' and both timestamps are counted.
+    """
+    status = _field(logs, 'status')
+    scheduled = _field(logs, 'scheduledTime')
+    taken_time = _field(logs, 'takenTime')
+    if status is None or scheduled is None or taken_time is None:
+        delays = np.zeros(0)
+        timed = np.zeros(len(logs), dtype=bool)
+    else:
+        scheduled_at = _parse_instants(scheduled)
+        taken_at = _parse_instants(taken_time)
+        timed = (status.eq('taken') & scheduled_at.notna() & taken_at.notna()).to_numpy()
+        delays = ((taken_at - scheduled_at).dt.total_seconds() / 60).to_numpy()[timed]
+    
+    result = {
+        "late_after_minutes": late_after,
+        "bins": _delay_bins(),
+        "overall": _group_delays(np.zeros(len(delays), dtype=np.int64), delays, 1, late_after)[0]
+    }
+    if not len(delays):
+        return result
+    
+    # Hour and weekday of the scheduled time, read as in count_logs
+    scheduled = _parse_times(scheduled)
+    groupings = [("by_hour", scheduled.dt.hour[timed].astype(np.int64), None),
+                 ("by_day_of_week", scheduled.dt.dayofweek[timed].astype(np.int64), DAY_NAMES)]
+    medications = _field(logs, 'medicationId')
+    if medications is not None:
+        groupings.insert(0, ("by_medication", medications[timed].astype(str), None))
+    for key, values, names in groupings:
+        codes, labels = pd.factorize(values, sort=True)
+        stats = _group_delays(codes.astype(np.int64), delays, len(labels), late_after)
+        result[key] = {
+            (names[int(label)] if names else str(label)): entry
+            for label, entry in zip(labels.tolist(), stats)
+        }
+    return result
+
+def analyze_logs(logs, state=None, timing=False):
+    """
+    Adherence rate, weekly trend and time-of-day stats for a list of logs.
+    
+    If state (a token from a previous response) is given, logs only need to
+    contain the entries added since that response; they are merged into
+    the saved counts, so the cost is proportional to the new logs only.
+    The response carries the updated token under 'state'.
+    
+    With timing=True the response also has 'timing' (see timing_stats),
+    computed from the logs in this request only: the state token keeps
+    dose counts, not delays.
+    """
+    counts = decode_state(state) if state else empty_counts()
+    if logs:
+        counts = counts + count_logs(logs)
+    
+    result = summarize_counts(counts)
+    result['state'] = encode_state(counts)
+    if timing:
+        with metrics.timed('timing'):
+            result['timing'] = timing_stats(logs)
+    return result
@@ -1,44 +1,328 @@
-from flask import Flask, request, jsonify
+import hmac
+import os
+import sys
+import time
+import threading
+import importlib
+
+_import_start = time.perf_counter()
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
+_flask_imported = time.perf_counter()
 from model.predictor import AdherencePredictor
-import pandas as pd
-import numpy as np
-import os
-from datetime import datetime
+from model.batcher import MicroBatcher
+from model.cache import PredictionCache
+from model.bundle import BUNDLE_PATH
+from model.reloader import BundleWatcher
+from model.features import FeatureStore, parse_time
+from model import metrics
+_predictor_imported = time.perf_counter()
+
+# Import/load timing breakdown reported at /health
+startup_timings = {
+    'import_flask_ms': round((_flask_imported - _import_start) * 1000, 2),
+    'import_predictor_ms': round((_predictor_imported - _flask_imported) * 1000, 2)
+}
+
+# With ML_LAZY_LOAD=1 the model is loaded on the first request that needs it,
+# so the server binds its port without waiting for the model.
+LAZY_LOAD = os.environ.get('ML_LAZY_LOAD', '0') == '1'
+
+# INFERENCE_BACKEND picks how the forest is evaluated (see model/predictor.py).
+# The default 'auto' loads only the flat forest at startup and unpickles the
+# sklearn model on the first batch over FLAT_MAX_ROWS rows; 'sklearn' unpickles
+# it at load time, which adds about 1.6 s to every cold start.
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'auto')
+
+# With ML_BATCHING=1 concurrent /predict calls are coalesced into one model
+# call per ML_BATCH_MAX_SIZE rows or ML_BATCH_MAX_WAIT_MS, whichever is first.
+# Run under a threaded server (e.g. gunicorn --worker-class gthread) so that
+# requests actually overlap.
+BATCHING = os.environ.get('ML_BATCHING', '0') == '1'
+BATCH_MAX_SIZE = int(os.environ.get('ML_BATCH_MAX_SIZE', 64))
+BATCH_MAX_WAIT_MS = float(os.environ.get('ML_BATCH_MAX_WAIT_MS', 5))
+
+# Up to ML_CACHE_SIZE prediction results are cached for ML_CACHE_TTL_S seconds,
+# keyed on the validated inputs and the model version. ML_CACHE_SIZE=0 disables it.
+CACHE_SIZE = int(os.environ.get('ML_CACHE_SIZE', 10000))
+CACHE_TTL_S = float(os.environ.get('ML_CACHE_TTL_S', 300))
+
+# The model bundle is checked for changes every ML_RELOAD_INTERVAL_S seconds
+# and a new one is loaded, warmed up and swapped in without a restart.
+# ML_RELOAD_INTERVAL_S=0 disables it.
+RELOAD_INTERVAL_S = float(os.environ.get('ML_RELOAD_INTERVAL_S', 5))
+
+# Per-user features (rolling adherence rates over ML_FEATURE_WINDOWS_DAYS,
+# time since the last taken dose) are kept from logs posted to
+# /features/ingest, so /predict can take a user_id and time instead of
+# past_adherence_rate and hours_since_last_dose. past_adherence_rate uses the
+# ML_FEATURE_RATE_WINDOW_DAYS window. The store lives in process memory.
+FEATURE_WINDOWS_DAYS = [int(days) for days in
+                        os.environ.get('ML_FEATURE_WINDOWS_DAYS', '7,30').split(',')]
+FEATURE_RATE_WINDOW_DAYS = int(os.environ.get('ML_FEATURE_RATE_WINDOW_DAYS', 30))
+
+# Shared secret the backend sends in the X-Internal-Token header. The
+# /features routes and predictions by user_id read or write a user's
+# history, so they need it; with ML_INTERNAL_TOKEN unset they are refused.
+INTERNAL_TOKEN = os.environ.get('ML_INTERNAL_TOKEN', '')
 
 app = Flask(__name__)
 CORS(app)
 
+predictor = None
+batcher = None
+watcher = None
+prediction_cache = PredictionCache(CACHE_SIZE, CACHE_TTL_S) if CACHE_SIZE > 0 else None
+feature_store = FeatureStore(FEATURE_WINDOWS_DAYS, FEATURE_RATE_WINDOW_DAYS)
+_predictor_lock = threading.Lock()
+
+def lazy_import(name):
+    """Import a heavy module on first use and record how long it took"""
+    module = sys.modules.get(name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        startup_timings[f'import_{name}_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return module
+
+def _predict_batch(records):
+    # Tag each entry with the version that scored it, in case of a swap meanwhile
+    current = predictor
+    results = current.predict_batch(records)
+    for entry in results:
+        entry['model_version'] = current.version
+    return results
+
+def build_predictor():
+    return AdherencePredictor(
+        threshold=float(os.environ.get('ADHERENCE_THRESHOLD', 0.5)),
+        backend=INFERENCE_BACKEND,
+        cache=prediction_cache
+    )
+
+def install_predictor(new_predictor):
+    """
+    Swap in a loaded predictor. Handlers read the global once per request,
+    so in-flight requests finish on the predictor they started with.
+    """
+    global predictor
+    previous = predictor.version if predictor else None
+    predictor = new_predictor
+    print(f"✓ Model reloaded (version {previous} -> {new_predictor.version})")
+
+def current_version():
+    return predictor.version if predictor else None
+
+def load_predictor():
+    global predictor, batcher, watcher
+    start = time.perf_counter()
+    try:
+        predictor = build_predictor()
+        startup_timings['model_load_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        print(f"✓ Model loaded successfully (version {predictor.version})")
+    except Exception as e:
+        print(f"✗ Error loading model: {e}")
+        predictor = None
+    
+    # Created whatever the load result: a model the watcher installs later is
+    # served through it too
+    if BATCHING and batcher is None:
+        batcher = MicroBatcher(_predict_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS)
+    
+    # Also started after a failed load, so a fixed bundle is picked up
+    if RELOAD_INTERVAL_S > 0 and watcher is None:
+        watcher = BundleWatcher(BUNDLE_PATH, build_predictor, install_predictor,
+                                current_version, RELOAD_INTERVAL_S).start()
+
+def get_predictor():
+    """Return the predictor, loading it first in lazy mode"""
+    if predictor is None and LAZY_LOAD:
+        with _predictor_lock:
+            if predictor is None:
+                load_predictor()
+    return predictor
+
 # Initialize predictor
-try:
-    predictor = AdherencePredictor()
-    print("✓ Model loaded successfully")
-except Exception as e:
-    print(f"✗ Error loading model: {e}")
-    predictor = None
+if not LAZY_LOAD:
+    load_predictor()
+
+def is_internal_request():
+    """True if the request carries the backend's ML_INTERNAL_TOKEN"""
+    token = request.headers.get('X-Internal-Token', '')
+    return bool(INTERNAL_TOKEN) and hmac.compare_digest(token.encode(), INTERNAL_TOKEN.encode())
+
+def forbidden():
+    return jsonify({'success': False, 'error': 'Internal token required'}), 403
+
+def uses_user_history(record):
+    return isinstance(record, dict) and record.get('user_id') is not None
+
+def read_json():
+    """Request body as JSON, timed as the 'deserialize' stage"""
+    with metrics.timed('deserialize'):
+        return request.get_json()
+
+def json_response(payload):
+    """jsonify() timed as the 'serialize' stage"""
+    with metrics.timed('serialize'):
+        return jsonify(payload)
+
+# Per-route latency and status counts, served at /metrics (off with ML_METRICS=0)
+if metrics.ENABLED:
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+    
+    @app.after_request
+    def record_request(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            metrics.request_latency.observe(time.perf_counter() - start, route, request.method)
+            metrics.requests_total.inc(route, request.method, str(response.status_code))
+        return response
+    
+    def startup_seconds():
+        timings = dict(startup_timings)
+        if predictor is not None:
+            timings.update(predictor.load_timings)
+        return {(name[:-len('_ms')],): ms / 1000 for name, ms in timings.items()}
+    
+    def model_info():
+        return {(predictor.version,): 1} if predictor else {}
+    
+    metrics.registry.gauge_callback(
+        'ml_startup_seconds', 'Import and model load times (same steps as /health)',
+        ['step'], startup_seconds)
+    metrics.registry.gauge_callback(
+        'ml_model_info', 'Version of the loaded model', ['version'], model_info)
+    
+    def cache_stats():
+        if prediction_cache is None:
+            return {}
+        stats = prediction_cache.stats()
+        return {(name,): stats[name] for name in
+                ['hits', 'misses', 'expired', 'evictions', 'invalidations', 'size']}
+    
+    metrics.registry.gauge_callback(
+        'ml_prediction_cache', 'Prediction cache counters since startup and current size',
+        ['stat'], cache_stats)
+    
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        """Prometheus text exposition of the request and hot-path metrics"""
+        return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/health', methods=['GET'])
 def health():
+    timings = dict(startup_timings)
+    if predictor is not None:
+        timings.update(predictor.load_timings)
+    
     return jsonify({
         'status': 'OK',
-        'model_loaded': predictor is not None
+        'model_loaded': predictor is not None,
+        'model_version': predictor.version if predictor else None,
+        'lazy_load': LAZY_LOAD,
+        'timings': timings,
+        'batching': batcher.stats() if batcher else None,
+        'cache': prediction_cache.stats() if prediction_cache else None,
+        'reload': watcher.stats() if watcher else None,
+        'features': feature_store.stats()
     })
 
 @app.route('/predict', methods=['POST'])
 def predict():
     """
     Predict adherence risk
+    
+    Either send every input field, or a user_id and time (ISO 8601) to use
+    the feature store: { "user_id": "...", "time": "2026-01-05T08:00:00Z" }.
+    Fields sent explicitly override the stored ones. user_id needs the
+    internal token (see ML_INTERNAL_TOKEN).
     """
+    predictor = get_predictor()
     if not predictor:
         return jsonify({'error': 'Model not loaded'}), 500
     
     try:
-        data = request.json
-        result = predictor.predict_adherence(data)
+        data = read_json()
+        if uses_user_history(data) and not is_internal_request():
+            return forbidden()
+        data, features = feature_store.complete(data)
+        if batcher:
+            entry = batcher.submit(data).result()
+            if not entry['success']:
+                return jsonify(entry), 400
+            result = entry['prediction']
+            version = entry['model_version']
+        else:
+            result = predictor.predict_adherence(data)
+            version = predictor.version
+        response = {
+            'success': True,
+            'prediction': result,
+            'model_version': version
+        }
+        if uses_user_history(data):
+            # None if the store has nothing for this user (see /features/backfill)
+            response['features'] = features
+        return json_response(response)
+    except Exception as e:
         return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Predict adherence risk for many inputs in one call
+    Expected Input: { "records": [ { "hour_of_day": 8, ... }, ... ] }
+    Records may use user_id and time as in /predict; the response then
+    maps each of those users to whether the store had their complete
+    history (see /features/backfill).
+    """
+    predictor = get_predictor()
+    if not predictor:
+        return jsonify({'error': 'Model not loaded'}), 500
+    
+    data = read_json() or {}
+    records = data.get('records')
+    if not isinstance(records, list):
+        return jsonify({
+            'success': False,
+            'error': "'records' must be a list"
+        }), 400
+    if any(uses_user_history(record) for record in records) and not is_internal_request():
+        return forbidden()
+    
+    try:
+        completed = []
+        errors = {}
+        history_complete = {}
+        for i, record in enumerate(records):
+            try:
+                record, features = feature_store.complete(record)
+            except ValueError as e:
+                errors[i] = {'success': False, 'error': str(e)}
+                continue
+            completed.append(record)
+            if uses_user_history(record):
+                history_complete[str(record['user_id'])] = bool(features and features['history_complete'])
+        results = predictor.predict_batch(completed)
+        # Put rows with an invalid time back in input order
+        for i in sorted(errors):
+            results.insert(i, errors[i])
+        response = {
             'success': True,
-            'prediction': result
-        })
+            'count': len(results),
+            'predictions': results,
+            'model_version': predictor.version
+        }
+        if history_complete:
+            response['history_complete'] = history_complete
+        return json_response(response)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -50,19 +334,26 @@ def suggest_times():
     """
     Suggest optimal reminder times
     """
+    predictor = get_predictor()
     if not predictor:
         return jsonify({'error': 'Model not loaded'}), 500
     
     try:
-        data = request.json
+        data = read_json()
         num_meds = data.get('num_daily_meds', 1)
         past_rate = data.get('past_adherence_rate', 0.8)
         
-        suggestions = predictor.suggest_optimal_time(num_meds, past_rate)
+        suggestions = predictor.suggest_optimal_time(
+            num_meds, past_rate,
+            hours=data.get('hours'),
+            day_of_week=data.get('day_of_week'),
+            top_k=data.get('top_k', 3)
+        )
         
-        return jsonify({
+        return json_response({
             'success': True,
-            'suggested_times': suggestions
+            'suggested_times': suggestions,
+            'model_version': predictor.version
         })
     except Exception as e:
         return jsonify({
@@ -70,6 +361,63 @@ def suggest_times():
             'error': str(e)
         }), 400
 
+@app.route('/features/ingest', methods=['POST'])
+def ingest_features():
+    """
+    Fold new adherence logs into the per-user feature store.
+    Expected Input: { "logs": [ { "userId": "...", "scheduledTime": "...", "status": "taken",
+                                  "takenTime": "..." }, ... ] }
+    """
+    if not is_internal_request():
+        return forbidden()
+    
+    data = read_json() or {}
+    logs = data.get('logs')
+    if not isinstance(logs, list):
+        return jsonify({
+            'success': False,
+            'error': "'logs' must be a list"
+        }), 400
+    
+    return json_response({'success': True, **feature_store.ingest(logs)})
+
+@app.route('/features/backfill', methods=['POST'])
+def backfill_features():
+    """
+    Replace one user's stored features with their recent history, e.g.
+    after a restart emptied the store.
+    Expected Input: { "user_id": "...", "logs": [ { "scheduledTime": "...", "status": "taken",
+                                                   "takenTime": "..." }, ... ] }
+    """
+    if not is_internal_request():
+        return forbidden()
+    
+    data = read_json() or {}
+    logs = data.get('logs')
+    if data.get('user_id') is None or not isinstance(logs, list):
+        return jsonify({
+            'success': False,
+            'error': "'user_id' and a 'logs' list are required"
+        }), 400
+    
+    return json_response({'success': True, **feature_store.backfill(data['user_id'], logs)})
+
+@app.route('/features/<user_id>', methods=['GET'])
+def user_features(user_id):
+    """Stored features of one user, as of ?time= (ISO 8601, default now)"""
+    if not is_internal_request():
+        return forbidden()
+    
+    try:
+        now = parse_time(request.args['time']) if 'time' in request.args else None
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    features = feature_store.features(user_id, now)
+    if features is None:
+        return jsonify({'success': False, 'error': 'Unknown user'}), 404
+    return json_response({'success': True, 'features': features})
+
 # ---------------------------------------------------------
 # NEW: Analytics Endpoint for Real-time Charts
 # ---------------------------------------------------------
@@ -78,69 +426,28 @@ def analyze_data():
     """
     Analyzes user logs to return data for charts.
     Expected Input: { "logs": [ { "status": "taken", "scheduledTime": "...", "date": "..." }, ... ] }
+    
+    Incremental mode: send back the "state" token from the previous response
+    together with only the logs added since then.
+    Expected Input: { "state": "<token>", "logs": [ ...new logs... ] }
+    
+    Dose timing: with "timing": true the response also has delay
+    percentiles, histograms and the late-dose rate of the taken logs
+    (takenTime - scheduledTime), overall and per medication, hour and day.
     """
     try:
-        req_data = request.json
+        analytics = lazy_import('analytics')
+        req_data = read_json()
         logs = req_data.get('logs', [])
+        state = req_data.get('state')
+        timing = bool(req_data.get('timing', False))
 
-        # 1. Handle empty data
-        if not logs:
-            return jsonify({
-                "adherence_rate": 0,
-                "total_doses": 0,
-                "weekly_trend": {},
-                "time_of_day_stats": {}
-            })
-
-        # 2. Convert to DataFrame
-        df = pd.DataFrame(logs)
-
-        # Ensure 'status' column exists
-        if 'status' not in df.columns:
-            return jsonify({"error": "Data missing 'status' field"}), 400
-
-        # 3. Calculate Overall Adherence Rate
-        total_doses = len(df)
-        taken_doses = len(df[df['status'] == 'taken'])
-        adherence_rate = (taken_doses / total_doses) * 100 if total_doses > 0 else 0
-
-        # 4. Process Dates for Weekly Trend
-        # Assuming incoming date format is ISO or standard string. Adjust if necessary.
-        # We try to convert 'date' or 'scheduledTime' to datetime objects
-        date_col = 'date' if 'date' in df.columns else 'scheduledTime'
-        if date_col in df.columns:
-            df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
-            
-            # Extract Day Name (Monday, Tuesday...)
-            df['day_name'] = df[date_col].dt.day_name()
-            
-            # Count 'taken' doses per day
-            weekly_trend = df[df['status'] == 'taken']['day_name'].value_counts().to_dict()
-            
-            # Extract Hour for Time of Day
-            df['hour'] = df[date_col].dt.hour
-            
-            # 5. Calculate Time of Day Patterns
-            def get_time_of_day(hour):
-                if 5 <= hour < 12: return 'Morning'
-                elif 12 <= hour < 17: return 'Afternoon'
-                elif 17 <= hour < 22: return 'Evening'
-                else: return 'Night'
-            
-            df['time_period'] = df['hour'].apply(get_time_of_day)
-            time_of_day_stats = df[df['status'] == 'taken']['time_period'].value_counts().to_dict()
-        else:
-            weekly_trend = {}
-            time_of_day_stats = {}
-
-        # 6. Return JSON for Flutter to render
-        return jsonify({
-            "adherence_rate": round(adherence_rate, 2),
-            "total_doses": total_doses,
-            "weekly_trend": weekly_trend,       # e.g., {"Monday": 5, "Tuesday": 3}
-            "time_of_day_stats": time_of_day_stats # e.g., {"Morning": 10, "Evening": 2}
-        })
+        # Count doses per day x time period x status in one pass, merge with
+        # the saved counts if any, then derive every chart from those counts
+        return json_response(analytics.analyze_logs(logs, state, timing))
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Analytics Error: {e}")
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,173 @@
+"""
+Benchmarks for ML inference and the Flask handlers.
+
+The suite times predict_adherence, suggest_optimal_time, batch scoring
+and the /predict, /suggest-times and /analyze handlers (through the
+Flask test client), with the prediction cache off so every call runs
+inference; predict_adherence[cache hit] times the cached path. Each run
+is saved to .benchmarks/ as JSON, tagged with the git revision, and
+compared with the previous saved run; any case slower than the previous
+run by more than --tolerance is reported as a regression and the exit
+status is 1.
+
+With --paths, instead compares the legacy two-pass path (model.predict
+followed by model.predict_proba) with the single-pass score() path, for
+single requests and for batches of 1 / 100 / 10k rows, and the sklearn
+and flat-forest inference backends.
+
+Usage (from ml-service/):
+    python benchmark.py [--tolerance 0.2] [--no-save]
+    python benchmark.py --paths
+"""
+import argparse
+import os
+import sys
+import warnings
+import numpy as np
+from model.predictor import AdherencePredictor
+from model.cache import PredictionCache
+from bench_utils import previous_results, report_regressions, save_results, time_call
+
+BATCH_SIZES = [1, 100, 10000]
+
+# /analyze payload sizes (number of logs)
+ANALYZE_SIZES = [100, 10000]
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.benchmarks')
+
+SAMPLE_INPUT = {
+    'hour_of_day': 8,
+    'day_of_week': 2,
+    'num_daily_meds': 2,
+    'past_adherence_rate': 0.8,
+    'hours_since_last_dose': 8
+}
+
+def random_raw_inputs(n, seed=0):
+    """Random raw inputs in INPUT_FIELDS order"""
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.integers(0, 24, n),
+        rng.integers(0, 7, n),
+        rng.integers(1, 6, n),
+        rng.uniform(0, 1, n),
+        rng.integers(0, 24, n)
+    ])
+
+def two_pass(predictor, features):
+    """The pre-optimisation inference path: one forest walk per call"""
+    predictor.model.predict(features)
+    predictor.model.predict_proba(features)
+
+def random_logs(n, seed=0):
+    """/analyze logs with random status and scheduled times over one month"""
+    rng = np.random.default_rng(seed)
+    minutes = rng.integers(0, 30 * 24 * 60, n)
+    times = np.datetime64('2024-01-01T00:00') + minutes.astype('timedelta64[m]')
+    statuses = np.where(rng.random(n) < 0.8, 'taken', 'missed')
+    return [
+        {'status': status, 'scheduledTime': f"{scheduled}:00"}
+        for status, scheduled in zip(statuses.tolist(), times.astype(str).tolist())
+    ]
+
+def post_json(client, url, payload):
+    """POST through the test client, failing loudly if the handler errors"""
+    response = client.post(url, json=payload)
+    if response.status_code != 200:
+        raise RuntimeError(f"{url} returned {response.status_code}: {response.get_data(as_text=True)}")
+    return response
+
+def suite_cases():
+    """(name, fn) pairs timed by run_suite()"""
+    # SAMPLE_INPUT never changes, so with the cache on every case would be a hit
+    os.environ['ML_CACHE_SIZE'] = '0'
+    from app import app, get_predictor
+    predictor = get_predictor()
+    if predictor is None:
+        raise RuntimeError("Model not loaded")
+    client = app.test_client()
+    cached = AdherencePredictor(cache=PredictionCache())
+    
+    cases = [
+        ('predict_adherence', lambda: predictor.predict_adherence(SAMPLE_INPUT)),
+        ('predict_adherence[cache hit]', lambda: cached.predict_adherence(SAMPLE_INPUT)),
+        ('suggest_optimal_time', lambda: predictor.suggest_optimal_time(2, 0.8)),
+    ]
+    for n in BATCH_SIZES:
+        records = [SAMPLE_INPUT] * n
+        cases.append((f'predict_batch[{n}]', lambda records=records: predictor.predict_batch(records)))
+    
+    cases += [
+        ('POST /predict', lambda: post_json(client, '/predict', SAMPLE_INPUT)),
+        ('POST /suggest-times', lambda: post_json(client, '/suggest-times', {
+            'num_daily_meds': 2, 'past_adherence_rate': 0.8})),
+    ]
+    for n in ANALYZE_SIZES:
+        payload = {'logs': random_logs(n)}
+        cases.append((f'POST /analyze[{n}]',
+                      lambda payload=payload: post_json(client, '/analyze', payload)))
+    return cases
+
+def run_suite(cases):
+    """Time every case; returns {name: seconds per call}"""
+    results = {}
+    print(f"{'case':<28} {'ms/call':>12}")
+    for name, fn in cases:
+        results[name] = time_call(fn)
+        print(f"{name:<28} {results[name] * 1000:>12.3f}")
+    return results
+
+def run_paths_benchmark():
+    predictor = AdherencePredictor(backend='sklearn')
+    
+    print("\n=== Single request (predict_adherence) ===")
+    single_features = predictor.prepare_features(SAMPLE_INPUT)
+    before = time_call(lambda: two_pass(predictor, single_features))
+    after = time_call(lambda: predictor.predict_adherence(SAMPLE_INPUT))
+    print(f"{'before':>10}: {before * 1000:8.3f} ms/call")
+    print(f"{'after':>10}: {after * 1000:8.3f} ms/call")
+    print(f"{'speedup':>10}: {before / after:8.2f}x")
+    
+    print("\n=== Batches (score) ===")
+    print(f"{'rows':>8} {'before ms':>12} {'after ms':>12} {'us/row':>10} {'speedup':>9}")
+    for n in BATCH_SIZES:
+        features = predictor.prepare_feature_matrix(random_raw_inputs(n))
+        before = time_call(lambda: two_pass(predictor, features))
+        after = time_call(lambda: predictor.score(features))
+        print(f"{n:>8} {before * 1000:>12.3f} {after * 1000:>12.3f} "
+              f"{after / n * 1e6:>10.2f} {before / after:>8.2f}x")
+
+    print("\n=== Inference backends (predict_proba) ===")
+    flat = AdherencePredictor(backend='flat')
+    print(f"{'rows':>8} {'sklearn ms':>12} {'flat ms':>12} {'speedup':>9}")
+    for n in BATCH_SIZES:
+        features = predictor.prepare_feature_matrix(random_raw_inputs(n))
+        sklearn_time = time_call(lambda: predictor.predict_proba(features))
+        flat_time = time_call(lambda: flat.predict_proba(features))
+        print(f"{n:>8} {sklearn_time * 1000:>12.3f} {flat_time * 1000:>12.3f} "
+              f"{sklearn_time / flat_time:>8.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ML inference and handlers")
+    parser.add_argument('--paths', action='store_true',
+                        help="compare inference paths and backends instead of running the suite")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed slowdown against the previous run (0.2 = 20%%)")
+    parser.add_argument('--no-save', action='store_true', help="do not store this run")
+    args = parser.parse_args()
+    
+    # sklearn warns about missing feature names on every ndarray call
+    warnings.filterwarnings('ignore', category=UserWarning)
+    if args.paths:
+        run_paths_benchmark()
+        return 0
+    
+    previous = previous_results(RESULTS_DIR)
+    results = run_suite(suite_cases())
+    if not args.no_save:
+        path = save_results(results, RESULTS_DIR, {'numpy': np.__version__})
+        print(f"\n✓ Results saved to {path}")
+    return report_regressions(previous, results, args.tolerance)
+
+if __name__ == "__main__":
+    sys.exit(main())
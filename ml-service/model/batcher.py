@@ -0,0 +1,106 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-row predictions into batches.
+    
+    Request threads call submit() and wait on the returned Future. A
+    background thread takes the first queued row, keeps collecting until
+    max_batch_size rows are queued or max_wait_ms has passed since that
+    row arrived (whichever comes first), then scores the batch with one
+    predict_batch call and resolves each Future with its own result.
+    """
+    
+    def __init__(self, predict_batch, max_batch_size=64, max_wait_ms=5):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'batches': 0,
+            'rows': 0,
+            'max_batch_size': 0,
+            'queue_wait_ms_total': 0.0,
+            'queue_wait_ms_max': 0.0
+        }
+        # Batch size distribution: upper bound -> count
+        self._size_buckets = {bound: 0 for bound in [1, 2, 4, 8, 16, 32, 64, 128, 256]}
+        self._size_buckets['+Inf'] = 0
+        
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+    
+    def submit(self, record):
+        """Queue one prediction input; returns a Future for its result entry"""
+        future = Future()
+        self._queue.put((record, future, time.perf_counter()))
+        return future
+    
+    def _collect(self):
+        """Block for the first item, then gather until the batch is full or due"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            records = [record for record, _, _ in batch]
+            
+            try:
+                results = self.predict_batch(records)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            
+            self._record(len(batch), [started - queued for _, _, queued in batch])
+    
+    def _record(self, size, waits):
+        with self._stats_lock:
+            self._stats['batches'] += 1
+            self._stats['rows'] += size
+            self._stats['max_batch_size'] = max(self._stats['max_batch_size'], size)
+            self._stats['queue_wait_ms_total'] += sum(waits) * 1000
+            self._stats['queue_wait_ms_max'] = max(self._stats['queue_wait_ms_max'], max(waits) * 1000)
+            for bound in self._size_buckets:
+                if bound == '+Inf' or size <= bound:
+                    self._size_buckets[bound] += 1
+                    break
+    
+    def stats(self):
+        """Batch size and queue wait metrics since startup"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            buckets = dict(self._size_buckets)
+        rows = stats.pop('rows')
+        wait_total = stats.pop('queue_wait_ms_total')
+        return {
+            'batches': stats['batches'],
+            'rows': rows,
+            'mean_batch_size': round(rows / stats['batches'], 2) if stats['batches'] else 0,
+            'max_batch_size': stats['max_batch_size'],
+            'mean_queue_wait_ms': round(wait_total / rows, 3) if rows else 0,
+            'max_queue_wait_ms': round(stats['queue_wait_ms_max'], 3),
+            'batch_size_buckets': {str(bound): count for bound, count in buckets.items()},
+            'queue_depth': self._queue.qsize(),
+            'config': {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000
+            }
+        }
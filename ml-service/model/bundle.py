@@ -0,0 +1,135 @@
+import hashlib
+import os
+import pickle
+import time
+from datetime import datetime, timezone
+import joblib
+import numpy as np
+from model.flat_forest import FlatForest
+
+BUNDLE_FORMAT = 1
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+BUNDLE_PATH = os.path.join(DATA_DIR, 'model_bundle.joblib')
+LEGACY_MODEL_PATH = os.path.join(DATA_DIR, 'trained_model.pkl')
+LEGACY_FEATURES_PATH = os.path.join(DATA_DIR, 'feature_columns.pkl')
+
+def save_bundle(path, model, feature_columns, metadata=None):
+    """
+    Write a single versioned model bundle.
+    
+    The bundle holds the feature columns, metadata, the forest as flat
+    NumPy arrays and the pickled sklearn model as a uint8 array. It is
+    stored uncompressed so every array can be memory-mapped on load, and
+    the sklearn model (and sklearn itself) is only unpickled when needed.
+    
+    The file is written next to path and renamed over it, so a server that
+    has the previous bundle memory-mapped keeps reading the old file and
+    a watcher never sees a partly written bundle.
+    """
+    model_bytes = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+    created_at = datetime.now(timezone.utc)
+    version = f"{created_at:%Y%m%d%H%M%S}-{hashlib.sha1(model_bytes).hexdigest()[:8]}"
+    flat_forest = FlatForest.from_sklearn(model)
+    
+    bundle = {
+        'format': BUNDLE_FORMAT,
+        'version': version,
+        'created_at': created_at.isoformat(),
+        'feature_columns': list(feature_columns),
+        'classes': np.asarray(model.classes_),
+        'metadata': metadata or {},
+        'flat_forest': {name: getattr(flat_forest, name) for name in
+                        ['feature', 'threshold', 'left', 'right', 'value', 'roots']},
+        'max_depth': flat_forest.max_depth,
+        'model_pickle': np.frombuffer(model_bytes, dtype=np.uint8)
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        joblib.dump(bundle, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return version
+
+class ModelBundle:
+    """A loaded model: version, feature columns, flat forest and lazy sklearn model"""
+    
+    def __init__(self, version, feature_columns, classes, flat_forest,
+                 metadata=None, model=None, model_pickle=None, created_at=None):
+        self.version = version
+        self.feature_columns = feature_columns
+        self.classes_ = classes
+        self.flat_forest = flat_forest
+        self.metadata = metadata or {}
+        self.created_at = created_at
+        self._model = model
+        self._model_pickle = model_pickle
+        self.timings = {}
+    
+    @property
+    def model(self):
+        """The sklearn estimator, unpickled on first use"""
+        if self._model is None:
+            start = time.perf_counter()
+            self._model = pickle.loads(self._model_pickle)
+            self.timings['model_unpickle_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return self._model
+    
+    @classmethod
+    def load(cls, path=BUNDLE_PATH, mmap_mode='r'):
+        """Load a bundle written by save_bundle(), memory-mapping its arrays"""
+        start = time.perf_counter()
+        data = joblib.load(path, mmap_mode=mmap_mode)
+        if data.get('format') != BUNDLE_FORMAT:
+            raise ValueError(f"Unsupported model bundle format: {data.get('format')}")
+        
+        flat_forest = FlatForest(
+            classes=data['classes'],
+            max_depth=data['max_depth'],
+            **data['flat_forest']
+        )
+        bundle = cls(
+            version=data['version'],
+            feature_columns=data['feature_columns'],
+            classes=data['classes'],
+            flat_forest=flat_forest,
+            metadata=data['metadata'],
+            model_pickle=data['model_pickle'],
+            created_at=data['created_at']
+        )
+        bundle.timings['bundle_load_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        return bundle
+    
+    @classmethod
+    def load_legacy(cls, model_path=LEGACY_MODEL_PATH, features_path=LEGACY_FEATURES_PATH):
+        """Load the separate trained_model.pkl / feature_columns.pkl files"""
+        start = time.perf_counter()
+        model = joblib.load(model_path)
+        feature_columns = joblib.load(features_path)
+        loaded = time.perf_counter()
+        flat_forest = FlatForest.from_sklearn(model)
+        
+        bundle = cls(
+            version=f"legacy-{int(os.path.getmtime(model_path))}",
+            feature_columns=feature_columns,
+            classes=np.asarray(model.classes_),
+            flat_forest=flat_forest,
+            model=model
+        )
+        bundle.timings['legacy_load_ms'] = round((loaded - start) * 1000, 2)
+        bundle.timings['flatten_ms'] = round((time.perf_counter() - loaded) * 1000, 2)
+        return bundle
+
+def load_model_bundle(bundle_path=BUNDLE_PATH, model_path=LEGACY_MODEL_PATH):
+    """Load the versioned bundle if present, else fall back to the legacy files"""
+    if os.path.exists(bundle_path):
+        return ModelBundle.load(bundle_path)
+    return ModelBundle.load_legacy(model_path)
+
+if __name__ == "__main__":
+    # Convert the legacy trained_model.pkl / feature_columns.pkl into a bundle
+    legacy = ModelBundle.load_legacy()
+    version = save_bundle(BUNDLE_PATH, legacy.model, legacy.feature_columns)
+    print(f"✓ Model bundle {version} saved to {BUNDLE_PATH}")
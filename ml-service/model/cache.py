@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+class PredictionCache:
+    """
+    Bounded LRU cache of prediction results.
+    
+    Entries are keyed on the normalized input vector (validated raw inputs
+    in INPUT_FIELDS order, as floats) and expire ttl_seconds after they
+    were stored. The cache belongs to one model version: a lookup or store
+    for a different version clears it first, so results from a previous
+    model are never served after a new bundle is loaded.
+    """
+    
+    def __init__(self, max_size=10000, ttl_seconds=300, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self.clock = clock
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+    
+    @staticmethod
+    def key(values):
+        """Cache key for validated raw inputs, so 8 and 8.0 share an entry"""
+        return tuple(float(value) for value in values)
+    
+    def _use_version(self, version):
+        if version != self.version:
+            if self._entries:
+                self._stats['invalidations'] += 1
+            self._entries.clear()
+            self.version = version
+    
+    def get(self, version, key):
+        """Cached result for key under this model version, or None"""
+        with self._lock:
+            self._use_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            
+            value, expires = entry
+            if self.clock() >= expires:
+                del self._entries[key]
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return dict(value)
+    
+    def put(self, version, key, value):
+        with self._lock:
+            self._use_version(version)
+            self._entries[key] = (dict(value), self.clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        """Hit/miss counters since startup and the current size"""
+        with self._lock:
+            stats = dict(self._stats)
+            size = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        return {
+            **stats,
+            'hit_rate': round(stats['hits'] / lookups, 4) if lookups else 0,
+            'size': size,
+            'version': self.version,
+            'config': {
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl
+            }
+        }
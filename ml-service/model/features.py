@@ -0,0 +1,252 @@
+import threading
+from datetime import datetime, timezone
+
+SECONDS_PER_DAY = 86400
+
+def parse_time(value):
+    """
+    ISO 8601 string (as the backend sends dates) or epoch milliseconds to a
+    datetime; naive times are taken as UTC. Raises ValueError otherwise.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid time: {value!r}")
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, timezone.utc)
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid time: {value!r}")
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Invalid time: {value!r}")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+class _UserState:
+    """
+    Dose counts of one user per UTC day for the last max-window days, in a
+    ring buffer, plus the running total/taken sum of each window.
+    history_complete is set once the user's history was backfilled.
+    """
+    __slots__ = ('day', 'total', 'taken', 'sums', 'last_taken', 'doses', 'history_complete')
+    
+    def __init__(self, span, n_windows, day):
+        self.history_complete = False
+        self.day = day
+        self.total = [0] * span
+        self.taken = [0] * span
+        self.sums = [[0, 0] for _ in range(n_windows)]
+        self.last_taken = None
+        self.doses = 0
+
+class FeatureStore:
+    """
+    Per-user model inputs maintained from adherence logs as they arrive.
+    
+    For each user it keeps dose counts per day over the longest window,
+    ending on the user's latest scheduled day, and the running sums of
+    every window (e.g. 7 and 30 days). Only ingest() moves that window
+    forward, expiring the days that left each window, so ingesting a log
+    and reading the features as of the latest day take constant time.
+    Logs older than the longest window still update the time of the last
+    taken dose but not the rates.
+    
+    Reads never change the stored counts: features for any other day are
+    summed from the kept days that fall in each window (at most the
+    longest window of them), so days before the kept range are missing
+    from reads far in the past.
+    
+    past_adherence_rate is the rate over rate_window days ending on the
+    day asked about, and hours_since_last_dose the time since the latest
+    takenTime. Users with no doses in the window get no rate, so the
+    predictor falls back to its defaults.
+    
+    The store lives in process memory. A user first seen through ingest()
+    only has the logs posted since the service started, which features()
+    reports as history_complete False; backfill() replaces that with the
+    user's full recent history from the backend's database.
+    """
+    
+    def __init__(self, windows_days=(7, 30), rate_window=None):
+        self.windows = sorted(set(int(days) for days in windows_days))
+        if not self.windows or self.windows[0] < 1:
+            raise ValueError("Feature windows must be at least 1 day")
+        self.rate_window = rate_window or self.windows[-1]
+        if self.rate_window not in self.windows:
+            raise ValueError(f"Rate window {self.rate_window} is not one of {self.windows}")
+        self.span = self.windows[-1]
+        self._users = {}
+        self._lock = threading.Lock()
+        self._stats = {'ingested': 0, 'skipped': 0, 'backfilled': 0}
+    
+    def _advance(self, state, day):
+        """Move a user's window end forward to day, expiring days that left each window"""
+        if day <= state.day:
+            return
+        if day - state.day >= self.span:
+            # Every counted day has left every window
+            state.total = [0] * self.span
+            state.taken = [0] * self.span
+            state.sums = [[0, 0] for _ in self.windows]
+        else:
+            for new_day in range(state.day + 1, day + 1):
+                for sums, window in zip(state.sums, self.windows):
+                    slot = (new_day - window) % self.span
+                    sums[0] -= state.total[slot]
+                    sums[1] -= state.taken[slot]
+                # The slot last held new_day - span, already out of every window
+                slot = new_day % self.span
+                state.total[slot] = state.taken[slot] = 0
+        state.day = day
+    
+    def _window_sums(self, state, day):
+        """(total, taken) of each window ending on day, read without changing state"""
+        if day == state.day:
+            return [tuple(sums) for sums in state.sums]
+        oldest = state.day - self.span + 1
+        result = []
+        for window in self.windows:
+            total = taken = 0
+            for kept_day in range(max(day - window + 1, oldest), min(day, state.day) + 1):
+                slot = kept_day % self.span
+                total += state.total[slot]
+                taken += state.taken[slot]
+            result.append((total, taken))
+        return result
+    
+    def _add(self, user_id, scheduled, taken, taken_at):
+        day = int(scheduled.timestamp() // SECONDS_PER_DAY)
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState(self.span, len(self.windows), day)
+        self._advance(state, day)
+        
+        age = state.day - day
+        if age < self.span:
+            slot = day % self.span
+            state.total[slot] += 1
+            state.taken[slot] += taken
+            for sums, window in zip(state.sums, self.windows):
+                if age < window:
+                    sums[0] += 1
+                    sums[1] += taken
+        
+        if taken_at is not None:
+            timestamp = taken_at.timestamp()
+            if state.last_taken is None or timestamp > state.last_taken:
+                state.last_taken = timestamp
+        state.doses += 1
+    
+    def ingest(self, logs):
+        """
+        Fold adherence logs into the store.
+        
+        Expected Input: [ { "userId": "...", "scheduledTime": "...", "status": "taken",
+                            "takenTime": "..." }, ... ]
+        Logs without a user or a valid scheduledTime are skipped. Returns
+        the number ingested and skipped.
+        """
+        parsed, skipped = self._parse(logs)
+        with self._lock:
+            for entry in parsed:
+                self._add(*entry)
+            self._stats['ingested'] += len(parsed)
+            self._stats['skipped'] += skipped
+        return {'ingested': len(parsed), 'skipped': skipped}
+    
+    def backfill(self, user_id, logs, now=None):
+        """
+        Replace one user's state with logs (at least the longest window of
+        them, plus the latest taken dose) and mark the history complete,
+        even if there are no logs. Logs need no userId.
+        """
+        user_id = str(user_id)
+        parsed, skipped = self._parse(logs, user_id)
+        parsed = [entry for entry in parsed if entry[0] == user_id]
+        today = int((now or datetime.now(timezone.utc)).timestamp() // SECONDS_PER_DAY)
+        with self._lock:
+            state = self._users[user_id] = _UserState(self.span, len(self.windows), today)
+            state.history_complete = True
+            for entry in parsed:
+                self._add(*entry)
+            self._stats['backfilled'] += 1
+            self._stats['skipped'] += skipped
+        return {'ingested': len(parsed), 'skipped': skipped}
+    
+    @staticmethod
+    def _parse(logs, user_id=None):
+        """(user id, scheduled, taken 0/1, taken time) per valid log, and the count skipped"""
+        parsed = []
+        skipped = 0
+        for log in logs:
+            try:
+                user_id_of_log = log.get('userId', user_id)
+                if user_id_of_log is None:
+                    raise ValueError("Missing userId")
+                scheduled = parse_time(log.get('scheduledTime'))
+                taken = log.get('status') == 'taken'
+                taken_time = log.get('takenTime')
+                taken_at = parse_time(taken_time) if taken and taken_time is not None else None
+            except (AttributeError, ValueError):
+                skipped += 1
+                continue
+            parsed.append((str(user_id_of_log), scheduled, int(taken), taken_at))
+        return parsed, skipped
+    
+    def features(self, user_id, now=None):
+        """
+        Features of one user as of now (default: current time), or None for
+        an unknown user: adherence rate and dose count per window,
+        past_adherence_rate and hours_since_last_dose (None if unknown)
+        """
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            state = self._users.get(str(user_id))
+            if state is None:
+                return None
+            sums = self._window_sums(state, int(now.timestamp() // SECONDS_PER_DAY))
+            last_taken = state.last_taken
+            doses = state.doses
+            history_complete = state.history_complete
+        
+        result = {'user_id': str(user_id), 'doses': doses, 'history_complete': history_complete}
+        for (total, taken), window in zip(sums, self.windows):
+            result[f'doses_{window}d'] = total
+            result[f'adherence_rate_{window}d'] = round(taken / total, 4) if total else None
+        result['past_adherence_rate'] = result[f'adherence_rate_{self.rate_window}d']
+        hours = None if last_taken is None else (now.timestamp() - last_taken) / 3600
+        result['hours_since_last_dose'] = None if hours is None else round(max(hours, 0), 2)
+        return result
+    
+    def complete(self, data):
+        """
+        Prediction input with the store's values filled in: hour_of_day and
+        day_of_week from 'time' (in its own UTC offset), past_adherence_rate
+        and hours_since_last_dose from 'user_id'. Fields given explicitly
+        win. Returns (input, features used or None).
+        """
+        if not isinstance(data, dict) or ('user_id' not in data and 'time' not in data):
+            return data, None
+        
+        completed = dict(data)
+        now = datetime.now(timezone.utc)
+        if data.get('time') is not None:
+            now = parse_time(data['time'])
+            completed.setdefault('hour_of_day', now.hour)
+            completed.setdefault('day_of_week', now.weekday())
+        
+        features = None
+        if data.get('user_id') is not None:
+            features = self.features(data['user_id'], now)
+            if features is not None:
+                for field in ('past_adherence_rate', 'hours_since_last_dose'):
+                    if completed.get(field) is None:
+                        completed[field] = features[field]
+        return completed, features
+    
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'users': len(self._users),
+                'windows_days': self.windows,
+                'rate_window_days': self.rate_window
+            }
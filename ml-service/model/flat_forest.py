@@ -0,0 +1,99 @@
+import numpy as np
+
+class FlatForest:
+    """
+    A tree ensemble flattened into contiguous NumPy node arrays.
+    
+    All trees of a fitted sklearn RandomForestClassifier are concatenated
+    into one set of per-node arrays (feature, threshold, left, right,
+    value). Leaves point to themselves, so prediction is a fixed number of
+    vectorized steps over every (row, tree) pair at once, without sklearn's
+    per-call validation and dispatch.
+    """
+    
+    # Rows per traversal step; bounds the (rows x trees) working set
+    CHUNK_ROWS = 1024
+    
+    def __init__(self, feature, threshold, left, right, value, roots, classes, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.max_depth = int(max_depth)
+        # Interleaved [left, right] pairs so one gather picks the child
+        self._children = np.stack([left, right], axis=1).ravel()
+    
+    @classmethod
+    def from_sklearn(cls, model):
+        """Flatten a fitted RandomForestClassifier"""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            node_ids = np.arange(offset, offset + n, dtype=np.int32)
+            is_leaf = tree.children_left == -1
+            
+            # Leaves loop back to themselves so extra steps are no-ops
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset).astype(np.int32))
+            rights.append(np.where(is_leaf, node_ids, tree.children_right + offset).astype(np.int32))
+            
+            # Per-node class probabilities, as DecisionTreeClassifier.predict_proba
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0] = 1
+            values.append(value / normalizer)
+            
+            roots.append(offset)
+            offset += n
+            max_depth = max(max_depth, tree.max_depth)
+        
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int32),
+            classes=np.asarray(model.classes_),
+            max_depth=max_depth
+        )
+    
+    def _traverse(self, X):
+        """Return the leaf index reached by every (row, tree) pair"""
+        n_rows, n_features = X.shape
+        n_trees = self.roots.shape[0]
+        flat_X = X.ravel()
+        # Offset of each (row, tree) pair's row within flat_X
+        row_offsets = np.repeat(np.arange(n_rows, dtype=np.int64) * n_features, n_trees)
+        nodes = np.tile(self.roots, n_rows)
+        for _ in range(self.max_depth):
+            go_right = flat_X[row_offsets + self.feature[nodes]] > self.threshold[nodes]
+            nodes = self._children[2 * nodes + go_right]
+        return nodes.reshape(n_rows, n_trees)
+    
+    def predict_proba(self, X):
+        """Mean class probabilities over all trees, like sklearn's forest"""
+        # sklearn compares float32 inputs against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        proba = np.empty((X.shape[0], self.classes_.shape[0]), dtype=np.float64)
+        for start in range(0, X.shape[0], self.CHUNK_ROWS):
+            chunk = X[start:start + self.CHUNK_ROWS]
+            leaves = self._traverse(chunk)
+            proba[start:start + chunk.shape[0]] = self.value[leaves].mean(axis=1)
+        return proba
+    
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+    
+    def max_abs_difference(self, model, X):
+        """Largest absolute gap between this forest and model.predict_proba on X"""
+        expected = model.predict_proba(X)
+        return float(np.abs(self.predict_proba(np.asarray(X)) - expected).max())
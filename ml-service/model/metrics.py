@@ -0,0 +1,199 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# With ML_METRICS=0 nothing is recorded, timed() is a no-op and /metrics
+# is not served, so instrumented code pays only for a function call.
+ENABLED = os.environ.get('ML_METRICS', '1') == '1'
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Upper bounds (rows) of the batch size histogram buckets
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096, 16384)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+class Histogram:
+    """Observation counts per bucket, plus their sum and count"""
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Last slot counts observations above the largest bound (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def quantile(self, q):
+        """
+        Estimate the q-quantile by linear interpolation within its bucket,
+        as Prometheus' histogram_quantile() does. None if nothing observed.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+class MetricFamily:
+    """One named metric with a value per label combination"""
+    
+    def __init__(self, kind, name, help_text, labelnames, buckets=None):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.values = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value, *labels):
+        with self._lock:
+            histogram = self.values.get(labels)
+            if histogram is None:
+                histogram = self.values[labels] = Histogram(self.buckets)
+            histogram.observe(value)
+    
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+    
+    def snapshot(self):
+        """{labels: value} copy, histograms copied so rendering does not hold the lock"""
+        with self._lock:
+            if self.kind != 'histogram':
+                return dict(self.values)
+            copies = {}
+            for labels, histogram in self.values.items():
+                copy = Histogram(histogram.buckets)
+                copy.counts = list(histogram.counts)
+                copy.sum, copy.count = histogram.sum, histogram.count
+                copies[labels] = copy
+            return copies
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value) if value == value else 'NaN'
+    return str(value)
+
+class Registry:
+    """Metric families rendered together in the Prometheus text format"""
+    
+    def __init__(self):
+        self._families = {}
+        self._gauge_callbacks = []
+    
+    def _family(self, kind, name, help_text, labelnames, buckets=None):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = MetricFamily(kind, name, help_text,
+                                                          tuple(labelnames), buckets)
+        return family
+    
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._family('histogram', name, help_text, labelnames, buckets)
+    
+    def counter(self, name, help_text, labelnames=()):
+        return self._family('counter', name, help_text, labelnames)
+    
+    def gauge_callback(self, name, help_text, labelnames, collect):
+        """Gauge whose {labels: value} are read from collect() at render time"""
+        self._gauge_callbacks.append((name, help_text, tuple(labelnames), collect))
+    
+    def render(self):
+        lines = []
+        for family in list(self._families.values()):
+            lines += [f'# HELP {family.name} {family.help}', f'# TYPE {family.name} {family.kind}']
+            for labels, value in sorted(family.snapshot().items()):
+                if family.kind == 'histogram':
+                    lines += self._render_histogram(family, labels, value)
+                else:
+                    lines.append(f'{family.name}{_format_labels(family.labelnames, labels)} '
+                                 f'{_format_value(value)}')
+        for name, help_text, labelnames, collect in self._gauge_callbacks:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            for labels, value in sorted(collect().items()):
+                lines.append(f'{name}{_format_labels(labelnames, labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+    
+    @staticmethod
+    def _render_histogram(family, labels, histogram):
+        lines = []
+        cumulative = 0
+        bounds = [repr(float(bound)) for bound in histogram.buckets] + ['+Inf']
+        for bound, count in zip(bounds, histogram.counts):
+            cumulative += count
+            lines.append(f'{family.name}_bucket'
+                         f'{_format_labels(family.labelnames, labels, [("le", bound)])} {cumulative}')
+        label_text = _format_labels(family.labelnames, labels)
+        lines.append(f'{family.name}_sum{label_text} {_format_value(histogram.sum)}')
+        lines.append(f'{family.name}_count{label_text} {histogram.count}')
+        return lines
+
+registry = Registry()
+
+request_latency = registry.histogram(
+    'ml_request_duration_seconds', 'Request latency per route', ['route', 'method'])
+requests_total = registry.counter(
+    'ml_requests_total', 'Requests per route and response status', ['route', 'method', 'status'])
+stage_latency = registry.histogram(
+    'ml_stage_duration_seconds',
+    'Time spent in each hot-path stage (deserialize, prepare_features, inference, '
+    'build_frame, count, timing, serialize)', ['stage'])
+batch_rows = registry.histogram(
+    'ml_batch_rows', 'Rows per model call', ['source'], buckets=SIZE_BUCKETS)
+
+def _latency_quantiles():
+    values = {}
+    for (route, method), histogram in request_latency.snapshot().items():
+        for q in QUANTILES:
+            estimate = histogram.quantile(q)
+            if estimate is not None:
+                values[(route, method, str(q))] = estimate
+    return values
+
+registry.gauge_callback(
+    'ml_request_duration_quantile_seconds',
+    'Request latency quantiles per route, estimated from ml_request_duration_seconds',
+    ['route', 'method', 'quantile'], _latency_quantiles)
+
+@contextmanager
+def _timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_latency.observe(time.perf_counter() - start, stage)
+
+_NOOP = nullcontext()
+
+def timed(stage):
+    """Context manager recording its duration under ml_stage_duration_seconds{stage}"""
+    return _timed(stage) if ENABLED else _NOOP
+
+def observe_batch(rows, source):
+    """Record the number of rows scored by one model call"""
+    if ENABLED:
+        batch_rows.observe(rows, source)
@@ -1,11 +1,124 @@
-import joblib
 import numpy as np
 from datetime import datetime
+from model import metrics
+from model.bundle import BUNDLE_PATH, LEGACY_MODEL_PATH, load_model_bundle
+from model.suggestions import SuggestionEngine
+
+INFERENCE_BACKENDS = ['sklearn', 'flat', 'auto']
+
+# With the 'auto' backend, batches up to this size use the flattened forest;
+# above it sklearn's compiled traversal is faster.
+FLAT_MAX_ROWS = 512
+
+# Raw inputs accepted from callers, in the order they are stored in the
+# batch matrix. Derived flags (is_weekend, is_morning, is_evening) are
+# computed from these.
+INPUT_FIELDS = [
+    'hour_of_day',
+    'day_of_week',
+    'num_daily_meds',
+    'past_adherence_rate',
+    'hours_since_last_dose'
+]
+
+INPUT_DEFAULTS = {
+    'num_daily_meds': 1,
+    'past_adherence_rate': 0.8,
+    'hours_since_last_dose': 8
+}
+
+def validate_record(data, now=None):
+    """
+    Validate one prediction input and return its raw values in
+    INPUT_FIELDS order. Raises ValueError describing the first bad field.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Each record must be a JSON object')
+    
+    now = now or datetime.now()
+    defaults = dict(INPUT_DEFAULTS, hour_of_day=now.hour, day_of_week=now.weekday())
+    
+    values = []
+    for field in INPUT_FIELDS:
+        value = data.get(field)
+        if value is None:
+            value = defaults[field]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"'{field}' must be a number")
+        values.append(value)
+    
+    hour, day, num_meds, past_rate, hours_since = values
+    if not 0 <= hour <= 23:
+        raise ValueError("'hour_of_day' must be between 0 and 23")
+    if not 0 <= day <= 6:
+        raise ValueError("'day_of_week' must be between 0 and 6")
+    if num_meds < 0:
+        raise ValueError("'num_daily_meds' must not be negative")
+    if not 0 <= past_rate <= 1:
+        raise ValueError("'past_adherence_rate' must be between 0 and 1")
+    if hours_since < 0:
+        raise ValueError("'hours_since_last_dose' must not be negative")
+    
+    return values
+
+def risk_levels(risk_scores):
+    """Map an array of risk scores to 'low' / 'medium' / 'high'"""
+    return np.select(
+        [risk_scores < 0.3, risk_scores < 0.6],
+        ['low', 'medium'],
+        default='high'
+    )
 
 class AdherencePredictor:
-    def __init__(self, model_path='data/trained_model.pkl'):
-        self.model = joblib.load(model_path)
-        self.feature_columns = joblib.load('data/feature_columns.pkl')
+    def __init__(self, model_path=LEGACY_MODEL_PATH, threshold=0.5,
+                 backend='auto', bundle_path=BUNDLE_PATH, cache=None):
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}'")
+        
+        # Versioned bundle if one exists, else trained_model.pkl + feature_columns.pkl
+        self.bundle = load_model_bundle(bundle_path, model_path)
+        self.version = self.bundle.version
+        self.feature_columns = self.bundle.feature_columns
+        # Rows whose adherence probability is above this are predicted adherent
+        self.threshold = threshold
+        self.adherent_index = list(self.bundle.classes_).index(1)
+        
+        # 'auto' and 'flat' score from the flat forest, so the sklearn model
+        # is only unpickled (about 1.6 s) if a batch over FLAT_MAX_ROWS needs
+        # it; 'sklearn' unpickles it here, which every cold start then pays
+        self.backend = backend
+        self.flat_forest = None
+        if backend == 'sklearn':
+            self.bundle.model  # Unpickle now rather than on the first request
+        else:
+            self.flat_forest = self.bundle.flat_forest
+        
+        self.suggestions = SuggestionEngine(self)
+        # Optional PredictionCache for predict_adherence / predict_batch
+        self.cache = cache
+    
+    @property
+    def model(self):
+        """The sklearn estimator (loaded on first use for bundles)"""
+        return self.bundle.model
+    
+    @property
+    def load_timings(self):
+        return self.bundle.timings
+    
+    def warm_up(self):
+        """
+        Run the inference paths once so the first request after a load does
+        not pay for unpickling or first-call setup. Bypasses the cache.
+        """
+        now = datetime.now()
+        raw = [[hour, now.weekday(), INPUT_DEFAULTS['num_daily_meds'],
+                INPUT_DEFAULTS['past_adherence_rate'], INPUT_DEFAULTS['hours_since_last_dose']]
+               for hour in range(24)]
+        self.score(self.prepare_feature_matrix(raw))
+        self.score(self.prepare_features(dict(zip(INPUT_FIELDS, raw[0]))))
+        self.suggestions.surface(INPUT_DEFAULTS['num_daily_meds'],
+                                 INPUT_DEFAULTS['past_adherence_rate'])
     
     def prepare_features(self, data):
         """
@@ -38,6 +151,25 @@ class AdherencePredictor:
         feature_array = np.array([[features[col] for col in self.feature_columns]])
         return feature_array
     
+    def prepare_feature_matrix(self, raw):
+        """
+        Build the model feature matrix from an (n, 5) array of raw inputs
+        in INPUT_FIELDS order. Derived flags are computed column-wise.
+        """
+        raw = np.asarray(raw, dtype=np.float64)
+        hour = raw[:, 0]
+        day = raw[:, 1]
+        
+        columns = {field: raw[:, i] for i, field in enumerate(INPUT_FIELDS)}
+        columns['is_weekend'] = day >= 5
+        columns['is_morning'] = (hour >= 6) & (hour < 12)
+        columns['is_evening'] = (hour >= 18) & (hour < 23)
+        
+        features = np.empty((raw.shape[0], len(self.feature_columns)), dtype=np.float64)
+        for i, col in enumerate(self.feature_columns):
+            features[:, i] = columns[col]
+        return features
+    
     def predict_adherence(self, data):
         """
         Predict adherence probability
@@ -49,55 +181,121 @@ class AdherencePredictor:
             'risk_level': str,
             'risk_score': float
         }
+        
+        Input is validated like predict_batch's rows (ValueError on a bad
+        field), so both paths accept and reject the same records.
         """
-        features = self.prepare_features(data)
+        with metrics.timed('prepare_features'):
+            values = validate_record(data)
+            key = self.cache.key(values) if self.cache is not None else None
+            if key is not None:
+                cached = self.cache.get(self.version, key)
+                if cached is not None:
+                    return cached
+            features = self.prepare_features(dict(zip(INPUT_FIELDS, values)))
+        with metrics.timed('inference'):
+            scores = self.score(features)
+        metrics.observe_batch(1, 'single')
+        result = self.format_prediction(scores, 0)
         
-        # Get prediction and probability
-        prediction = self.model.predict(features)[0]
-        probability = self.model.predict_proba(features)[0]
+        if key is not None:
+            self.cache.put(self.version, key, result)
+        return result
+    
+    def predict_proba(self, features):
+        """Class probabilities from the configured inference backend"""
+        if self.flat_forest is not None:
+            if self.backend == 'flat' or features.shape[0] <= FLAT_MAX_ROWS:
+                return self.flat_forest.predict_proba(features)
+        return self.model.predict_proba(features)
+    
+    def score(self, features):
+        """
+        Score a feature matrix with a single pass over the forest.
         
-        adherence_prob = probability[1]  # Probability of adherence
-        risk_score = 1 - adherence_prob  # Risk of non-adherence
+        Returns a dict of per-row arrays: will_adhere, adherence_probability,
+        risk_score and risk_level.
+        """
+        probability = self.predict_proba(features)
         
-        # Determine risk level
-        if risk_score < 0.3:
-            risk_level = 'low'
-        elif risk_score < 0.6:
-            risk_level = 'medium'
-        else:
-            risk_level = 'high'
+        adherence_prob = probability[:, self.adherent_index]  # Probability of adherence
+        risk_score = 1 - adherence_prob  # Risk of non-adherence
         
         return {
-            'will_adhere': bool(prediction),
-            'adherence_probability': round(float(adherence_prob), 3),
-            'risk_level': risk_level,
-            'risk_score': round(float(risk_score), 3)
+            'will_adhere': adherence_prob > self.threshold,
+            'adherence_probability': adherence_prob,
+            'risk_level': risk_levels(risk_score),
+            'risk_score': risk_score
         }
     
-    def suggest_optimal_time(self, num_daily_meds, past_adherence_rate):
+    def format_prediction(self, scores, row):
+        """Convert one row of score() output to the JSON response shape"""
+        return {
+            'will_adhere': bool(scores['will_adhere'][row]),
+            'adherence_probability': round(float(scores['adherence_probability'][row]), 3),
+            'risk_level': str(scores['risk_level'][row]),
+            'risk_score': round(float(scores['risk_score'][row]), 3)
+        }
+    
+    def predict_batch(self, records):
+        """
+        Predict adherence for many inputs with a single model call.
+        
+        Returns one entry per input, in input order: either
+        {'success': True, 'prediction': {...}} or
+        {'success': False, 'error': str} for rows that failed validation.
+        With a cache, only rows without a cached result are scored.
+        """
+        now = datetime.now()
+        results = [None] * len(records)
+        valid_rows = []
+        valid_index = []
+        valid_keys = []
+        
+        with metrics.timed('prepare_features'):
+            for i, data in enumerate(records):
+                try:
+                    values = validate_record(data, now)
+                except ValueError as e:
+                    results[i] = {'success': False, 'error': str(e)}
+                    continue
+                
+                if self.cache is not None:
+                    key = self.cache.key(values)
+                    cached = self.cache.get(self.version, key)
+                    if cached is not None:
+                        results[i] = {'success': True, 'prediction': cached}
+                        continue
+                    valid_keys.append(key)
+                valid_rows.append(values)
+                valid_index.append(i)
+            features = self.prepare_feature_matrix(valid_rows) if valid_rows else None
+        
+        if valid_rows:
+            with metrics.timed('inference'):
+                scores = self.score(features)
+            metrics.observe_batch(len(valid_rows), 'batch')
+            for row, i in enumerate(valid_index):
+                prediction = self.format_prediction(scores, row)
+                if self.cache is not None:
+                    self.cache.put(self.version, valid_keys[row], prediction)
+                results[i] = {
+                    'success': True,
+                    'prediction': prediction
+                }
+        
+        return results
+    
+    def suggest_optimal_time(self, num_daily_meds, past_adherence_rate, hours=None,
+                             day_of_week=None, top_k=3):
         """
         Suggest optimal reminder times based on adherence patterns
+        
+        Looks up the precomputed probability surface for the given inputs and
+        returns the top_k of the candidate hours (default: 7-9, 13-14, 19-21
+        on a mid-week day).
         """
-        # Test different times of day
-        hours_to_test = [7, 8, 9, 13, 14, 19, 20, 21]
-        suggestions = []
-        
-        for hour in hours_to_test:
-            data = {
-                'hour_of_day': hour,
-                'day_of_week': 2,  # Mid-week
-                'num_daily_meds': num_daily_meds,
-                'past_adherence_rate': past_adherence_rate,
-                'hours_since_last_dose': 8
-            }
-            
-            result = self.predict_adherence(data)
-            suggestions.append({
-                'time': f"{hour:02d}:00",
-                'adherence_probability': result['adherence_probability']
-            })
-        
-        # Sort by probability
-        suggestions.sort(key=lambda x: x['adherence_probability'], reverse=True)
-        
-        return suggestions[:3]  # Return top 3
\ No newline at end of file
+        return self.suggestions.suggest(
+            num_daily_meds, past_adherence_rate,
+            hours=hours, day_of_week=day_of_week, top_k=top_k
+        )
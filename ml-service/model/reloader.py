@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+
+class BundleWatcher:
+    """
+    Hot-swaps the predictor when the model bundle file changes.
+    
+    A background thread polls the bundle's mtime and size every
+    interval_s seconds. On a change it builds a new predictor with
+    load(), warms it up and passes it to install(), which replaces the
+    served predictor in one assignment. Requests that already hold the
+    old predictor finish on it; later requests get the new one. If the
+    new bundle fails to load, the old predictor keeps serving and the
+    error is reported in stats().
+    """
+    
+    def __init__(self, path, load, install, current_version, interval_s=5):
+        self.path = path
+        self.load = load
+        self.install = install
+        self.current_version = current_version
+        self.interval_s = interval_s
+        self._signature = self._stat()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stats = {
+            'reloads': 0,
+            'failures': 0,
+            'last_error': None,
+            'last_reload_ms': None,
+            'last_reload_at': None
+        }
+        self._thread = threading.Thread(target=self._run, name='bundle-watcher', daemon=True)
+    
+    def start(self):
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._stop.set()
+    
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.check()
+    
+    def check(self):
+        """Reload if the bundle changed since the last check; returns True if swapped"""
+        with self._lock:
+            signature = self._stat()
+            if signature is None or signature == self._signature:
+                return False
+            self._signature = signature
+            
+            start = time.perf_counter()
+            try:
+                predictor = self.load()
+                if predictor.version == self.current_version():
+                    return False
+                predictor.warm_up()
+            except Exception as e:
+                self._stats['failures'] += 1
+                self._stats['last_error'] = str(e)
+                print(f"✗ Model reload failed, keeping the current model: {e}")
+                return False
+            
+            self.install(predictor)
+            self._stats['reloads'] += 1
+            self._stats['last_error'] = None
+            self._stats['last_reload_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            self._stats['last_reload_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+            return True
+    
+    def stats(self):
+        return {
+            **self._stats,
+            'path': self.path,
+            'interval_s': self.interval_s
+        }
@@ -0,0 +1,94 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_HOURS = [7, 8, 9, 13, 14, 19, 20, 21]
+DEFAULT_DAY_OF_WEEK = 2  # Mid-week
+HOURS_SINCE_LAST_DOSE = 8
+
+class SuggestionEngine:
+    """
+    Precomputed adherence probability surfaces for reminder-time suggestions.
+    
+    For a given (num_daily_meds, past_adherence_rate) pair the model is
+    scored once over every day_of_week x hour_of_day combination (168 rows)
+    and the resulting 7x24 table is kept in a bounded LRU cache, so a
+    suggestion request is a table lookup plus a top-k selection.
+    """
+    
+    def __init__(self, predictor, rate_step=0.01, cache_size=256):
+        self.predictor = predictor
+        self.rate_step = rate_step
+        self.cache_size = cache_size
+        self._surfaces = OrderedDict()
+        self._lock = threading.Lock()
+        
+        # Constant part of the 168-row grid, in INPUT_FIELDS order
+        days, hours = np.meshgrid(np.arange(7), np.arange(24), indexing='ij')
+        self._grid = np.zeros((7 * 24, 5), dtype=np.float64)
+        self._grid[:, 0] = hours.ravel()
+        self._grid[:, 1] = days.ravel()
+        self._grid[:, 4] = HOURS_SINCE_LAST_DOSE
+    
+    def _key(self, num_daily_meds, past_adherence_rate):
+        """Quantize inputs so nearby adherence rates share one surface"""
+        rate_bucket = int(round(min(max(past_adherence_rate, 0.0), 1.0) / self.rate_step))
+        return int(num_daily_meds), rate_bucket
+    
+    def surface(self, num_daily_meds, past_adherence_rate):
+        """Return the 7x24 adherence probability table (day_of_week, hour)"""
+        key = self._key(num_daily_meds, past_adherence_rate)
+        with self._lock:
+            table = self._surfaces.get(key)
+            if table is not None:
+                self._surfaces.move_to_end(key)
+                return table
+        
+        raw = self._grid.copy()
+        raw[:, 2] = key[0]
+        raw[:, 3] = key[1] * self.rate_step
+        scores = self.predictor.score(self.predictor.prepare_feature_matrix(raw))
+        table = scores['adherence_probability'].reshape(7, 24)
+        table.setflags(write=False)
+        
+        with self._lock:
+            self._surfaces[key] = table
+            self._surfaces.move_to_end(key)
+            while len(self._surfaces) > self.cache_size:
+                self._surfaces.popitem(last=False)
+        return table
+    
+    def suggest(self, num_daily_meds, past_adherence_rate, hours=None,
+                day_of_week=None, top_k=3):
+        """
+        Return the top_k candidate hours by predicted adherence probability.
+        
+        hours defaults to DEFAULT_HOURS and day_of_week to mid-week.
+        """
+        hours = DEFAULT_HOURS if hours is None else hours
+        day_of_week = DEFAULT_DAY_OF_WEEK if day_of_week is None else day_of_week
+        
+        if not hours:
+            raise ValueError("'hours' must not be empty")
+        if any(isinstance(h, bool) or not isinstance(h, int) or not 0 <= h <= 23 for h in hours):
+            raise ValueError("'hours' must be whole hours between 0 and 23")
+        if isinstance(day_of_week, bool) or not isinstance(day_of_week, int) or not 0 <= day_of_week <= 6:
+            raise ValueError("'day_of_week' must be between 0 and 6")
+        
+        table = self.surface(num_daily_meds, past_adherence_rate)
+        probabilities = [round(float(p), 3) for p in table[day_of_week, hours]]
+        
+        # sorted() is stable, so earlier candidates win ties
+        best = sorted(range(len(hours)), key=lambda i: probabilities[i], reverse=True)[:top_k]
+        return [
+            {
+                'time': f"{hours[i]:02d}:00",
+                'adherence_probability': probabilities[i]
+            }
+            for i in best
+        ]
+    
+    def clear(self):
+        """Drop all cached surfaces"""
+        with self._lock:
+            self._surfaces.clear()
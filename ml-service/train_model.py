@@ -1,32 +1,241 @@
-import pandas as pd
+"""
+Train the adherence RandomForest and write the serving bundle.
+
+Usage:
+    python train_model.py                       # fixed parameters (DEFAULT_PARAMS)
+    python train_model.py --search --workers 4  # successive-halving search over SEARCH_GRID
+    python train_model.py --search --max-latency-ms 0.5
+    python train_model.py --warm-start 50 --data data/new_logs.csv
+
+Training data is read with compact dtypes (int8 flags, float32 rates),
+so the frame is about a quarter of the default int64/float64 one. The
+whole training set is still held in memory. Train
+accuracy is the forest's out-of-bag score instead of a second pass over
+the training set.
+
+--search evaluates every candidate in a process pool on a small slice of
+the training set, keeps the best 1/HALVING_FACTOR, and repeats on
+HALVING_FACTOR times more rows until the full set, so weak candidates are
+cut off early. Each candidate records fit time, fit memory and
+prediction latency next to its validation accuracy; with --max-latency-ms
+only candidates within that single-row latency can be chosen.
+
+Every fit (each candidate and the final model) runs in a new worker
+process, and its fit memory is how far the fit raised that process's peak
+resident memory. ru_maxrss only ever grows, so in a reused worker it
+would report the largest fit that worker had run so far.
+
+--warm-start N loads the current model and adds N trees fitted on --data
+(e.g. only the new logs), keeping the existing trees.
+
+The chosen model's training time, fit memory and inference latency are
+stored in the bundle metadata alongside its accuracy.
+"""
+import argparse
+import itertools
+import math
+import multiprocessing
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+from sklearn.metrics import accuracy_score, classification_report
 import joblib
-import os
+from model.bundle import save_bundle
+from model.flat_forest import FlatForest
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+FEATURE_COLUMNS = [
+    'hour_of_day',
+    'day_of_week',
+    'num_daily_meds',
+    'past_adherence_rate',
+    'hours_since_last_dose',
+    'is_weekend',
+    'is_morning',
+    'is_evening'
+]
+TARGET_COLUMN = 'adherent'
+
+# sklearn trees split on float32 features, so float32 loses nothing
+TRAINING_DTYPES = {
+    'hour_of_day': 'int8',
+    'day_of_week': 'int8',
+    'num_daily_meds': 'int16',
+    'past_adherence_rate': 'float32',
+    'hours_since_last_dose': 'float32',
+    'is_weekend': 'int8',
+    'is_morning': 'int8',
+    'is_evening': 'int8',
+    'adherent': 'int8'
+}
+
+DEFAULT_PARAMS = {
+    'n_estimators': 100,
+    'max_depth': 10,
+    'min_samples_split': 5
+}
+
+SEARCH_GRID = {
+    'n_estimators': [50, 100, 200],
+    'max_depth': [6, 10, 16],
+    'min_samples_split': [2, 5, 10]
+}
+
+# Successive halving: keep 1/HALVING_FACTOR of the candidates per round
+HALVING_FACTOR = 3
+MIN_SEARCH_ROWS = 200
+
+DATA_PATH = 'data/sample_data.csv'
+MODEL_PATH = 'data/trained_model.pkl'
+FEATURES_PATH = 'data/feature_columns.pkl'
+BUNDLE_PATH = 'data/model_bundle.joblib'
+
+def load_training_data(path=DATA_PATH):
+    """Features and target from a training CSV, with compact dtypes"""
+    df = pd.read_csv(path, usecols=FEATURE_COLUMNS + [TARGET_COLUMN], dtype=TRAINING_DTYPES)
+    return df[FEATURE_COLUMNS], df[TARGET_COLUMN]
+
+def peak_memory_mb():
+    """Peak resident memory of this process so far, or None if unavailable"""
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS, KB elsewhere
+    scale = 2 ** 20 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+def fresh_process_pool(workers=None, **kwargs):
+    """
+    Process pool that runs each task in a new worker, so a task's peak
+    memory is not mixed up with earlier tasks'. Workers are forked from a
+    forkserver where there is one: a spawned child starts with the
+    parent's peak on Linux.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else None)
+    return ProcessPoolExecutor(workers, mp_context=context, max_tasks_per_child=1, **kwargs)
 
-def train_adherence_model():
+def time_per_call(fn, repeats=20):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+def serving_cost(model, X):
+    """
+    Prediction latency of a fitted forest: one row and a 1000-row batch
+    through sklearn, and one row through the flat forest the service uses
+    for small requests.
+    """
+    rows = np.asarray(X, dtype=np.float64)
+    batch = rows[np.arange(1000) % len(rows)]
+    single = rows[:1]
+    flat_forest = FlatForest.from_sklearn(model)
+    with warnings.catch_warnings():
+        # The service passes ndarrays; sklearn warns about the missing feature names
+        warnings.simplefilter('ignore', UserWarning)
+        sklearn_1_row = time_per_call(lambda: model.predict_proba(single))
+        sklearn_1k_rows = time_per_call(lambda: model.predict_proba(batch), 5)
+    return {
+        'sklearn_1_row_ms': round(sklearn_1_row * 1000, 3),
+        'sklearn_1k_rows_ms': round(sklearn_1k_rows * 1000, 3),
+        'flat_1_row_ms': round(time_per_call(lambda: flat_forest.predict_proba(single)) * 1000, 3),
+        'n_nodes': int(sum(tree.tree_.node_count for tree in model.estimators_))
+    }
+
+def make_forest(params, n_jobs=-1, oob_score=True):
+    return RandomForestClassifier(**params, oob_score=oob_score, random_state=42, n_jobs=n_jobs)
+
+def timed_fit(model, X, y):
+    """
+    Fit model; returns (model, seconds, MB the fit raised peak memory by).
+    Run it in a fresh process (see fresh_process_pool) for the memory to
+    be this fit's alone.
+    """
+    before = peak_memory_mb()
+    start = time.perf_counter()
+    model.fit(X, y)
+    seconds = time.perf_counter() - start
+    memory = None if before is None else round(peak_memory_mb() - before, 1)
+    return model, seconds, memory
+
+def fit_in_fresh_process(model, X, y):
+    """timed_fit() in a new worker process; the fitted model is sent back"""
+    with fresh_process_pool(1) as pool:
+        return pool.submit(timed_fit, model, X, y).result()
+
+# Search data, set once per worker process by _init_search_worker
+_search_data = None
+
+def _init_search_worker(X_train, y_train, X_val, y_val):
+    global _search_data
+    _search_data = (X_train, y_train, X_val, y_val)
+
+def evaluate_candidate(params, n_rows):
+    """Fit params on the first n_rows training rows; accuracy and serving cost"""
+    X_train, y_train, X_val, y_val = _search_data
+    model, fit_seconds, fit_memory = timed_fit(make_forest(params, n_jobs=1, oob_score=False),
+                                               X_train.iloc[:n_rows], y_train.iloc[:n_rows])
+    return {
+        'params': params,
+        'rows': n_rows,
+        'val_accuracy': round(float(accuracy_score(y_val, model.predict(X_val))), 4),
+        'fit_seconds': round(fit_seconds, 3),
+        'fit_memory_mb': fit_memory,
+        **serving_cost(model, X_val)
+    }
+
+def search_params(X_train, y_train, X_val, y_val, grid=SEARCH_GRID, workers=None,
+                  max_latency_ms=None):
+    """
+    Successive-halving search over grid in a process pool, one new
+    worker per candidate so each one's fit memory is its own.
+    
+    Returns (best params, results of the final round). Candidates over
+    max_latency_ms (flat forest, one row) are dropped after each round.
+    """
+    candidates = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    rounds = max(1, math.ceil(math.log(len(candidates), HALVING_FACTOR)))
+    n_rows = max(MIN_SEARCH_ROWS, len(X_train) // HALVING_FACTOR ** (rounds - 1))
+    
+    with fresh_process_pool(workers, initializer=_init_search_worker,
+                            initargs=(X_train, y_train, X_val, y_val)) as pool:
+        while True:
+            n_rows = min(n_rows, len(X_train))
+            results = list(pool.map(evaluate_candidate, candidates, itertools.repeat(n_rows)))
+            if max_latency_ms is not None:
+                results = [r for r in results if r['flat_1_row_ms'] <= max_latency_ms]
+                if not results:
+                    raise ValueError(f"No candidate predicts within {max_latency_ms} ms")
+            results.sort(key=lambda r: (-r['val_accuracy'], r['flat_1_row_ms']))
+            
+            print(f"\n{len(candidates)} candidates on {n_rows} rows:")
+            for r in results:
+                print(f"  {r['params']}  acc {r['val_accuracy']:.4f}  fit {r['fit_seconds']:.2f}s "
+                      f"{r['fit_memory_mb']} MB  1 row {r['flat_1_row_ms']:.3f} ms  "
+                      f"nodes {r['n_nodes']}")
+            
+            if n_rows >= len(X_train) or len(results) == 1:
+                return results[0]['params'], results
+            candidates = [r['params'] for r in results[:max(1, len(results) // HALVING_FACTOR)]]
+            n_rows *= HALVING_FACTOR
+
+def train_adherence_model(data_path=DATA_PATH, search=False, workers=None,
+                          max_latency_ms=None, warm_start=0):
     print("Loading data...")
-    # Load the data
-    df = pd.read_csv('data/sample_data.csv')
-    
-    # Features and target
-    feature_columns = [
-        'hour_of_day',
-        'day_of_week',
-        'num_daily_meds',
-        'past_adherence_rate',
-        'hours_since_last_dose',
-        'is_weekend',
-        'is_morning',
-        'is_evening'
-    ]
-    
-    X = df[feature_columns]
-    y = df['adherent']
-    
-    print(f"\nDataset shape: {X.shape}")
+    X, y = load_training_data(data_path)
+    
+    print(f"\nDataset shape: {X.shape} ({X.memory_usage(deep=True).sum() / 1024:.1f} KB)")
     print(f"Adherent: {y.sum()} ({y.mean():.2%})")
     print(f"Non-adherent: {len(y) - y.sum()} ({1 - y.mean():.2%})")
     
@@ -38,52 +247,106 @@ def train_adherence_model():
     print(f"\nTraining set: {X_train.shape[0]} samples")
     print(f"Test set: {X_test.shape[0]} samples")
     
-    # Train Random Forest model
-    print("\nTraining Random Forest model...")
-    model = RandomForestClassifier(
-        n_estimators=100,
-        max_depth=10,
-        min_samples_split=5,
-        random_state=42,
-        n_jobs=-1
-    )
-    
-    model.fit(X_train, y_train)
+    if warm_start:
+        # Add trees fitted on this data to the current model; the existing
+        # trees are kept as they are
+        model = joblib.load(MODEL_PATH)
+        params = {'n_estimators': model.n_estimators + warm_start}
+        print(f"\nAdding {warm_start} trees to the current {model.n_estimators}...")
+        model.set_params(warm_start=True, oob_score=False, **params)
+        model, fit_seconds, fit_memory = fit_in_fresh_process(model, X_train, y_train)
+        train_accuracy = None
+    else:
+        params = DEFAULT_PARAMS
+        if search:
+            # Search on a validation split of the training set; the test set stays unseen
+            X_fit, X_val, y_fit, y_val = train_test_split(
+                X_train, y_train, test_size=0.25, random_state=42, stratify=y_train
+            )
+            params, _ = search_params(X_fit, y_fit, X_val, y_val, workers=workers,
+                                      max_latency_ms=max_latency_ms)
+            print(f"\nBest parameters: {params}")
+        
+        print("\nTraining Random Forest model...")
+        model, fit_seconds, fit_memory = fit_in_fresh_process(make_forest(params), X_train, y_train)
+        # Out-of-bag estimate instead of re-predicting the training set
+        train_accuracy = float(model.oob_score_)
     
     # Evaluate
     print("\n=== Model Evaluation ===")
-    y_pred_train = model.predict(X_train)
     y_pred_test = model.predict(X_test)
-    
-    train_accuracy = accuracy_score(y_train, y_pred_train)
     test_accuracy = accuracy_score(y_test, y_pred_test)
     
-    print(f"Training Accuracy: {train_accuracy:.4f}")
+    if train_accuracy is not None:
+        print(f"Training Accuracy (out-of-bag): {train_accuracy:.4f}")
     print(f"Test Accuracy: {test_accuracy:.4f}")
     
     print("\n=== Classification Report ===")
-    print(classification_report(y_test, y_pred_test, 
+    print(classification_report(y_test, y_pred_test,
                                 target_names=['Non-adherent', 'Adherent']))
     
     # Feature importance
     print("\n=== Feature Importance ===")
     feature_importance = pd.DataFrame({
-        'feature': feature_columns,
+        'feature': FEATURE_COLUMNS,
         'importance': model.feature_importances_
     }).sort_values('importance', ascending=False)
     
     print(feature_importance)
     
+    print("\n=== Training and Serving Cost ===")
+    cost = {
+        'fit_seconds': round(fit_seconds, 3),
+        'fit_memory_mb': fit_memory,
+        **serving_cost(model, X_test)
+    }
+    for name, value in cost.items():
+        print(f"{name:>20}: {value}")
+    
     # Save the model
     os.makedirs('data', exist_ok=True)
-    joblib.dump(model, 'data/trained_model.pkl')
-    print("\n✓ Model saved to data/trained_model.pkl")
+    joblib.dump(model, MODEL_PATH)
+    print(f"\n✓ Model saved to {MODEL_PATH}")
     
     # Save feature columns for later use
-    joblib.dump(feature_columns, 'data/feature_columns.pkl')
+    joblib.dump(FEATURE_COLUMNS, FEATURES_PATH)
     print("✓ Feature columns saved")
     
+    # Single versioned bundle (model + feature columns + flat forest) for serving
+    flat_forest = FlatForest.from_sklearn(model)
+    max_diff = flat_forest.max_abs_difference(model, X_test)
+    if max_diff > 1e-9:
+        raise RuntimeError(f"Flat forest disagrees with sklearn (max diff {max_diff})")
+    version = save_bundle(BUNDLE_PATH, model, FEATURE_COLUMNS, metadata={
+        'train_accuracy': round(train_accuracy, 4) if train_accuracy is not None else None,
+        'test_accuracy': round(float(test_accuracy), 4),
+        'n_samples': int(len(X)),
+        'params': {name: model.get_params()[name] for name in DEFAULT_PARAMS},
+        'warm_start_trees': warm_start,
+        **cost
+    })
+    print(f"✓ Model bundle {version} saved to {BUNDLE_PATH} "
+          f"(flat forest max diff vs sklearn: {max_diff:.2e})")
+    
     return model
 
+def main():
+    parser = argparse.ArgumentParser(description="Train the adherence model")
+    parser.add_argument('--data', default=DATA_PATH, help="training CSV")
+    parser.add_argument('--search', action='store_true',
+                        help="successive-halving search over SEARCH_GRID")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="search processes (default: all CPUs)")
+    parser.add_argument('--max-latency-ms', type=float, default=None,
+                        help="only choose models within this one-row latency")
+    parser.add_argument('--warm-start', type=int, default=0, metavar='N',
+                        help="add N trees fitted on --data to the current model")
+    args = parser.parse_args()
+    if args.warm_start and args.search:
+        parser.error("--warm-start and --search cannot be combined")
+    
+    train_adherence_model(args.data, args.search, args.workers, args.max_latency_ms,
+                          args.warm_start)
+
 if __name__ == "__main__":
-    model = train_adherence_model()
\ No newline at end of file
+    main()